@@ -162,7 +162,7 @@ class AutoExportPane {
     if (!Services.prompt.confirm(null, l10n.localize('AutoExport.delete'), l10n.localize('AutoExport.delete.confirm'))) return
 
     const ae = AutoExport.db.get(parseInt(node.getAttributeNS(namespace, 'ae-id')))
-    Cache.getCollection(Translators.byId[ae.translatorID].label)?.removeDataOnly()
+    Cache.reset('auto-export removed', [Translators.byId[ae.translatorID].label])
     AutoExport.db.remove(ae)
     this.refresh()
   }
@@ -188,7 +188,7 @@ class AutoExportPane {
   public edit(node) {
     const field = node.getAttributeNS(namespace, 'ae-field')
     const ae = AutoExport.db.get(parseInt(node.getAttributeNS(namespace, 'ae-id')))
-    Cache.getCollection(Translators.byId[ae.translatorID].label).removeDataOnly()
+    Cache.reset(`auto-export ${field} changed`, [Translators.byId[ae.translatorID].label])
 
     switch (field) {
       case 'exportNotes':
@@ -199,6 +199,10 @@ const queue = new class TaskQueue {
     this.scheduler.schedule($loki, () => { this.run($loki).catch(err => log.error('autoexport failed:', {$loki}, err)) })
   }
 
+  public get pending(): number {
+    return this.scheduler.pending
+  }
+
   public cancel(ae) {
     const $loki = (typeof ae === 'number' ? ae : ae.$loki)
     this.scheduler.cancel($loki)
@@ -412,6 +416,10 @@ export const AutoExport = new class _AutoExport { // eslint-disable-line @typesc
     }
   }
 
+  public get queued(): number {
+    return queue.pending
+  }
+
   public run(id) {
     queue.run(id).catch(err => log.error('AutoExport.run:', err))
   }
@@ -381,6 +381,7 @@ Zotero.Translate.Export.prototype.Sandbox.BetterBibTeX = {
     collection.cloneObjects = false
     const cached = collection.findOne($and({...cacheSelector(sandbox.translator[0].label, options, prefs), itemID}))
     collection.cloneObjects = cloneObjects
+    Cache.count(collection.name, cached ? 1 : 0, cached ? 0 : 1)
 
     if (!cached) return false
 
@@ -638,7 +639,7 @@ function notify(event: string, handler: any) {
 notify('item-tag', (_action: any, _type: any, ids: any[], _extraData: any) => {
   ids = ids.map((item_tag: string) => parseInt(item_tag.split('-')[0]))
 
-  Cache.remove(ids, `item ${ids} changed`)
+  Cache.remove(ids, 'item changed')
   Events.emit('items-changed', ids)
 })
 
@@ -649,7 +650,7 @@ notify('item', (action: string, type: any, ids: any[], extraData: { [x: string]:
     if (!ids.length) return
   }
 
-  Cache.remove(ids, `item ${ids} changed`)
+  Cache.remove(ids, 'item changed')
 
   // safe to use Zotero.Items.get(...) rather than Zotero.Items.getAsync here
   // https://groups.google.com/forum/#!topic/zotero-dev/99wkhAk-jm0
@@ -662,7 +663,7 @@ notify('item', (action: string, type: any, ids: any[], extraData: { [x: string]:
 
     return true
   })
-  if (parentIDs.length) Cache.remove(parentIDs, `parent items ${parentIDs} changed`)
+  if (parentIDs.length) Cache.remove(parentIDs, 'parent item changed')
   const parents = parentIDs.length ? Zotero.Items.get(parentIDs) : []
 
   switch (action) {
@@ -11,16 +11,25 @@ import type { Preferences } from '../../gen/preferences/meta'
 
 const METADATA = 'Better BibTeX metadata'
 
+type Statistics = { hits: number, misses: number, invalidated: Record<string, number> }
+
 class Cache extends Loki {
   private initialized = false
+  // cache effectiveness per collection since the last resetStatistics; the test harness reads these around exports
+  private statistics: Record<string, Statistics> = {}
 
-  public remove(ids, _reason) {
+  // reasons are counted in the statistics, so they name the kind of change; the items go to the debug log
+  public remove(ids, reason: string) {
     if (!this.initialized) return
 
+    log.debug('cache remove:', reason, ids)
+
     const query = Array.isArray(ids) ? { itemID : { $in : ids } } : { itemID: { $eq: ids } }
 
     for (const coll of this.collections) {
+      const entries = coll.data.length
       coll.findAndRemove(query)
+      this.invalidated(coll.name, reason, entries - coll.data.length)
     }
   }
 
@@ -36,9 +45,30 @@ class Cache extends Loki {
 
   private drop(coll: any, reason: string) {
     log.debug(`dropping cache.${coll.name}:`, reason)
+    this.invalidated(coll.name, reason, coll.data.length)
     coll.removeDataOnly()
   }
 
+  private stats(name: string): Statistics {
+    return this.statistics[name] = this.statistics[name] || { hits: 0, misses: 0, invalidated: {} }
+  }
+
+  private invalidated(name: string, reason: string, entries: number) {
+    if (!entries) return
+    const stats = this.stats(name)
+    stats.invalidated[reason] = (stats.invalidated[reason] || 0) + entries
+  }
+
+  public count(name: string, hits: number, misses: number): void {
+    const stats = this.stats(name)
+    stats.hits += hits
+    stats.misses += misses
+  }
+
+  public resetStatistics(): void {
+    this.statistics = {}
+  }
+
   public async init() {
     await this.loadDatabaseAsync()
 
@@ -143,6 +173,15 @@ class Cache extends Loki {
       entries: this.collections.reduce((acc, coll) => acc + coll.data.length, 0),
     }
   }
+
+  public report(): Record<string, Statistics & { entries: number }> {
+    const report = {}
+    for (const coll of this.collections) {
+      const stats = this.stats(coll.name)
+      report[coll.name] = { entries: coll.data.length, hits: stats.hits, misses: stats.misses, invalidated: { ...stats.invalidated } }
+    }
+    return report
+  }
 }
 // export singleton: https://k94n.com/es6-modules-single-instance-pattern
 export const DB = new Cache('cache', { // eslint-disable-line @typescript-eslint/naming-convention,no-underscore-dangle,id-blacklist,id-match
@@ -44,6 +44,7 @@ export class KeyManager {
 
   private scanning: any[]
   private started = false
+  private updating = 0
 
   private getField(item: { getField: ((str: string) => string)}, field: string): string {
     try {
@@ -58,7 +59,7 @@ export class KeyManager {
     const ids = this.expandSelection('selected')
     if (ids.length !== 1) return alert(l10n.localize('Citekey.set.toomany'))
 
-    Cache.remove(ids, `setting key for ${ids}`)
+    Cache.remove(ids, 'citation key set')
     const existingKey = this.get(ids[0]).citekey
     const citationKey = prompt(l10n.localize('Citekey.set.change'), existingKey) || existingKey
     if (citationKey === existingKey) return
@@ -111,7 +112,7 @@ export class KeyManager {
   public async refresh(ids: 'selected' | number | number[], manual = false): Promise<void> {
     ids = this.expandSelection(ids)
 
-    Cache.remove(ids, `refreshing keys for ${ids}`)
+    Cache.remove(ids, 'citation keys refreshed')
 
     const warnAt = manual ? Preference.warnBulkModify : 0
     if (warnAt > 0 && ids.length > warnAt) {
@@ -299,43 +300,12 @@ export class KeyManager {
     })
 
     this.keys.on(['insert', 'update'], async (citekey: { itemID: number, itemKey: any, citekey: any, pinned: any }) => {
-      if (Preference.citekeySearch) {
-        await ZoteroDB.queryAsync('INSERT OR REPLACE INTO betterbibtexsearch.citekeys (itemID, itemKey, citekey) VALUES (?, ?, ?)', [ citekey.itemID, citekey.itemKey, citekey.citekey ])
-      }
-
-      // async is just a heap of fun. Who doesn't enjoy a good race condition?
-      // https://github.com/retorquere/zotero-better-bibtex/issues/774
-      // https://groups.google.com/forum/#!topic/zotero-dev/yGP4uJQCrMc
-      await sleep(Preference.itemObserverDelay)
-
-      let item
+      this.updating++
       try {
-        item = await Zotero.Items.getAsync(citekey.itemID)
-      }
-      catch (err) {
-        // assume item has been deleted before we could get to it -- did I mention I hate async? I hate async
-        log.error('could not load', citekey.itemID, err)
-        return
-      }
-
-      // update display panes by issuing a fake item-update notification
-      Zotero.Notifier.trigger('modify', 'item', [citekey.itemID], { [citekey.itemID]: { bbtCitekeyUpdate: true } })
-
-      if (!citekey.pinned && this.autopin.enabled) {
-        this.autopin.schedule(citekey.itemID, () => { this.pin([citekey.itemID]).catch(err => log.error('failed to pin', citekey.itemID, ':', err)) })
+        await this.propagate(citekey)
       }
-      if (citekey.pinned && Preference.keyConflictPolicy === 'change') {
-        const conflictQuery: Query = { $and: [
-          { itemID: { $ne: item.id } },
-          { pinned: { $eq: false } },
-          { citekey: { $eq: citekey.citekey } },
-        ]}
-        if (Preference.keyScope !== 'global')  conflictQuery.$and.push( { libraryID: { $eq: item.libraryID } } )
-
-        for (const conflict of this.keys.find(conflictQuery)) {
-          item = await Zotero.Items.getAsync(conflict.itemID)
-          this.update(item, conflict)
-        }
+      finally {
+        this.updating--
       }
     })
 
@@ -348,6 +318,58 @@ export class KeyManager {
     this.started = true
   }
 
+  // no citekey changes left to propagate or pin
+  public get idle(): boolean {
+    return this.updating === 0 && this.autopin.pending === 0
+  }
+
+  private async propagate(citekey: { itemID: number, itemKey: any, citekey: any, pinned: any }): Promise<void> {
+    if (Preference.citekeySearch) {
+      await ZoteroDB.queryAsync('INSERT OR REPLACE INTO betterbibtexsearch.citekeys (itemID, itemKey, citekey) VALUES (?, ?, ?)', [ citekey.itemID, citekey.itemKey, citekey.citekey ])
+    }
+
+    // async is just a heap of fun. Who doesn't enjoy a good race condition?
+    // https://github.com/retorquere/zotero-better-bibtex/issues/774
+    // https://groups.google.com/forum/#!topic/zotero-dev/yGP4uJQCrMc
+    await sleep(Preference.itemObserverDelay)
+
+    let item
+    try {
+      item = await Zotero.Items.getAsync(citekey.itemID)
+    }
+    catch (err) {
+      // assume item has been deleted before we could get to it -- did I mention I hate async? I hate async
+      log.error('could not load', citekey.itemID, err)
+      return
+    }
+
+    // update display panes by issuing a fake item-update notification
+    Zotero.Notifier.trigger('modify', 'item', [citekey.itemID], { [citekey.itemID]: { bbtCitekeyUpdate: true } })
+
+    if (!citekey.pinned && this.autopin.enabled) {
+      // the scheduler drops the item from pending when the callback starts, so count the pin as in flight until it is done
+      this.autopin.schedule(citekey.itemID, () => {
+        this.updating++
+        this.pin([citekey.itemID])
+          .catch(err => log.error('failed to pin', citekey.itemID, ':', err))
+          .then(() => { this.updating-- }) // runs whether or not the pin failed, as the catch above settles it
+      })
+    }
+    if (citekey.pinned && Preference.keyConflictPolicy === 'change') {
+      const conflictQuery: Query = { $and: [
+        { itemID: { $ne: item.id } },
+        { pinned: { $eq: false } },
+        { citekey: { $eq: citekey.citekey } },
+      ]}
+      if (Preference.keyScope !== 'global')  conflictQuery.$and.push( { libraryID: { $eq: item.libraryID } } )
+
+      for (const conflict of this.keys.find(conflictQuery)) {
+        item = await Zotero.Items.getAsync(conflict.itemID)
+        this.update(item, conflict)
+      }
+    }
+  }
+
   public async rescan(clean?: boolean): Promise<void> {
     if (Preference.scrubDatabase) {
       // eslint-disable-next-line @typescript-eslint/no-unsafe-return, no-prototype-builtins
@@ -23,6 +23,11 @@ export class Scheduler {
     return this.delay !== 0
   }
 
+  // handlers waiting for their timer; held handlers don't count, as they won't run until the scheduler is resumed
+  public get pending(): number {
+    return this.handlers.size
+  }
+
   public get paused(): boolean {
     return this.held !== null
   }
@@ -49,7 +54,10 @@ export class Scheduler {
     }
     else {
       if (this.handlers.has(id)) clearTimeout(this.handlers.get(id))
-      this.handlers.set(id, setTimeout(handler, this.delay))
+      this.handlers.set(id, setTimeout(() => {
+        this.handlers.delete(id)
+        handler()
+      }, this.delay))
     }
   }
 
@@ -42,10 +42,43 @@ export class TestSupport {
     return (AutoExport.db.find($and({ status: 'running' })).length > 0)
   }
 
+  // resolves as soon as all conditions hold, or with false when the timeout passes first, so the test harness needs
+  // neither fixed sleeps nor a bridge round-trip per poll
+  public async waitFor(conditions: string[], timeout: number, args: { ids?: number[] } = {}): Promise<boolean> {
+    const holds = (condition: string): boolean => {
+      switch (condition) {
+        case 'selected':
+          try {
+            return JSON.stringify(Zotero.getActiveZoteroPane().getSelectedItems(true).sort()) === JSON.stringify(args.ids.slice().sort())
+          }
+          catch (err) { // getSelectedItems errors out when there is no selection
+            return false
+          }
+
+        case 'auto-exports-done':
+          return !this.autoExportRunning() && AutoExport.queued === 0
+
+        case 'key-manager-idle':
+          return Zotero.BetterBibTeX.KeyManager.idle
+
+        default:
+          throw new Error(`Unknown condition ${condition}`)
+      }
+    }
+
+    const deadline = Date.now() + timeout
+    while (!conditions.every(holds)) {
+      if (Date.now() > deadline) return false
+      await sleep(10) // eslint-disable-line no-magic-numbers
+    }
+    return true
+  }
+
   public async reset(): Promise<void> {
     Zotero.BetterBibTeX.localeDateOrder = Zotero.Date.getLocaleDateOrder()
 
     Cache.reset('test environment reset')
+    Cache.resetStatistics()
 
     let collections
     const prefix = 'translators.better-bibtex.'
@@ -250,6 +283,10 @@ export class TestSupport {
     Cache.reset('requested during test')
   }
 
+  public cacheState(): Record<string, { entries: number, hits: number, misses: number, invalidated: Record<string, number> }> {
+    return Cache.report()
+  }
+
   public async merge(ids: number[]): Promise<void> {
     const zoteroPane = Zotero.getActiveZoteroPane()
     await zoteroPane.selectItems(ids, true)
@@ -454,6 +454,10 @@ export const Translators = new class { // eslint-disable-line @typescript-eslint
       }, {})
       cache.cloneObjects = cloneObjects
       cache.dirty = true
+
+      // notes and attachments never go into the cache
+      const hits = Object.keys(config.cache).length
+      Cache.count(cache.name, hits, config.items.filter(item => !['note', 'attachment'].includes(item.itemType)).length - hits)
     }
 
     // pre-fetch CSL serializations
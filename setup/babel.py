@@ -6,9 +6,33 @@ from collections import OrderedDict
 import itertools
 import json
 from collections import defaultdict
+import hashlib
 import os
+import sys
 
 print('parsing babel language mapping')
+
+# the parsed identification sections of the locale ini files are cached by content hash, together with a digest of
+# everything the mapping is built from; when that is unchanged the outputs are current and there is nothing to do
+CACHE = '.cache/babel.json'
+OUTPUTS = ['gen/babel/langmap.json', 'gen/babel/ids.json', 'gen/babel/tag.json']
+try:
+  with open(CACHE) as f:
+    cache = json.load(f)
+except (FileNotFoundError, json.JSONDecodeError):
+  cache = { 'digest': None, 'locales': {} }
+
+def sha256(path):
+  with open(path, 'rb') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+lbx = sorted(path.stem.lower() for path in Path('submodules/biblatex/tex/latex/biblatex/lbx').glob('*.lbx'))
+locales = [(path, sha256(path)) for path in sorted(Path('submodules/babel/locale').rglob('*.ini'), key=lambda p: p.name)]
+digest = hashlib.sha256(json.dumps([sha256(__file__), lbx, [(path.name, sha) for path, sha in locales]]).encode('utf-8')).hexdigest()
+if digest == cache['digest'] and all(os.path.exists(output) for output in OUTPUTS):
+  print('  up to date')
+  sys.exit(0)
+
 import sqlite3
 DB = sqlite3.connect(':memory:')
 class Row(sqlite3.Row):
@@ -57,7 +81,7 @@ class Trie:
     return {k: next(v for v in A if v.startswith(k)) for k in ans}
 
 DB.execute('CREATE TABLE biblatex (langid NOT NULL PRIMARY KEY)')
-DB.executemany('INSERT INTO biblatex (langid) VALUES (?)', [(path.stem.lower(),) for path in Path('submodules/biblatex/tex/latex/biblatex/lbx').glob('*.lbx')])
+DB.executemany('INSERT INTO biblatex (langid) VALUES (?)', [(langid,) for langid in lbx])
 
 class MultiOrderedDict(OrderedDict):
   def __setitem__(self, key, value):
@@ -66,11 +90,19 @@ class MultiOrderedDict(OrderedDict):
     else:
       super().__setitem__(key, value)
 
+def identification(path, sha):
+  if sha not in cache['locales']:
+    locale = RawConfigParser(dict_type=MultiOrderedDict, strict=False)
+    locale.read(str(path))
+    cache['locales'][sha] = dict(locale['identification'])
+  return cache['locales'][sha]
+
 DB.execute('CREATE TABLE babel (tag NOT NULL, prio NOT NULL, rel NOT NULL, langid NOT NULL)')
-for path in sorted(Path('submodules/babel/locale').rglob('*.ini'), key=lambda p: p.name):
-  locale = RawConfigParser(dict_type=MultiOrderedDict, strict=False)
-  locale.read(str(path))
-  locale = locale['identification']
+# the NOT EXISTS/NOT IN checks below look up by tag and langid
+DB.execute('CREATE INDEX babel_tag ON babel (tag, langid)')
+DB.execute('CREATE INDEX babel_langid ON babel (langid)')
+for path, sha in locales:
+  locale = identification(path, sha)
 
   if 'name.babel' not in locale:
     print(' ', path.name, 'has no name')
@@ -127,6 +159,7 @@ DB.execute('''
 ''')
 
 DB.execute('CREATE TABLE langmap (language NOT NULL PRIMARY KEY, langid NOT NULL)')
+DB.execute('CREATE INDEX langmap_langid ON langmap (langid)')
 DB.execute('INSERT INTO langmap (language, langid) SELECT tag, langid FROM babel WHERE prio = 0')
 
 # set self-alias
@@ -220,25 +253,38 @@ for prefix, language in Trie.prefix([row.language for row in DB.execute('SELECT
 for row in DB.execute('SELECT * FROM babel WHERE prio <> 0 AND langid NOT IN (SELECT language FROM langmap) ORDER BY langid'):
   print(' ', row.langid, '=>', row.tag, 'not mapped')
 
+def save(path, data):
+  # outputs are only rewritten when their content changes, so their timestamps don't trigger rebuilds downstream
+  data = json.dumps(data, indent='  ')
+  if os.path.exists(path):
+    with open(path) as f:
+      if f.read() == data: return
+  print('  writing', path)
+  with open(path, 'w') as f:
+    f.write(data)
+
 os.makedirs('gen/babel', exist_ok=True)
-with open('gen/babel/langmap.json', 'w') as f:
-  json.dump({ row.language: row.langid for row in DB.execute('SELECT * from langmap ORDER BY language')}, f, indent='  ')
-
-with open('gen/babel/ids.json', 'w') as f:
-  json.dump([ row.langid for row in DB.execute('SELECT DISTINCT langid from langmap ORDER BY langid')], f, indent='  ')
-
-with open('gen/babel/tag.json', 'w') as f:
-  tag = {}
-  for langid in ['en', 'ja', 'zh', 'de']:
-    language = f"SELECT DISTINCT langid FROM langmap WHERE language = '{langid}' OR language LIKE '{langid}-%'"
-    language = DB.execute(f'''
-      {language}
-      UNION
-      SELECT DISTINCT language FROM langmap WHERE langid IN ({language})
-    ''')
-    for row in language:
-      tag[row.langid] = langid
-  json.dump(tag, f, indent='  ')
+save('gen/babel/langmap.json', { row.language: row.langid for row in DB.execute('SELECT * from langmap ORDER BY language')})
+
+save('gen/babel/ids.json', [ row.langid for row in DB.execute('SELECT DISTINCT langid from langmap ORDER BY langid')])
+
+tag = {}
+for langid in ['en', 'ja', 'zh', 'de']:
+  language = f"SELECT DISTINCT langid FROM langmap WHERE language = '{langid}' OR language LIKE '{langid}-%'"
+  language = DB.execute(f'''
+    {language}
+    UNION
+    SELECT DISTINCT language FROM langmap WHERE langid IN ({language})
+  ''')
+  for row in language:
+    tag[row.langid] = langid
+save('gen/babel/tag.json', tag)
+
+# only keep the locales that are still around
+cache = { 'digest': digest, 'locales': { sha: cache['locales'][sha] for _, sha in locales if sha in cache['locales'] } }
+os.makedirs(os.path.dirname(CACHE), exist_ok=True)
+with open(CACHE, 'w') as f:
+  json.dump(cache, f)
 
 #for line in DB.iterdump():
 #  print(line)
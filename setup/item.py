@@ -7,7 +7,6 @@ from networkx.readwrite import json_graph
 
 from collections import OrderedDict
 import hashlib
-import operator
 import shlex
 from functools import reduce
 from http.client import RemoteDisconnected
@@ -17,10 +16,11 @@ from mako.template import Template
 from munch import Munch
 from pytablewriter import MarkdownTableWriter
 from urllib.error import HTTPError
-from urllib.request import urlopen, urlretrieve, Request
+from urllib.request import urlopen, Request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import glob
 import itertools
-import json, jsonpatch, jsonpath_ng
+import json, jsonpatch
 import mako
 import networkx as nx
 import os
@@ -29,6 +29,7 @@ import re
 import sys
 import tarfile
 import tempfile
+import threading
 import zipfile
 import fnmatch
 
@@ -49,6 +50,49 @@ def readurl(url):
     req.add_header('Authorization', f'token {token}')
   return urlopen(req).read().decode('utf-8')
 
+def release_key(release):
+  return [int(n) for n in release.replace('m', '.').split('.')]
+
+class JarCache:
+  # downloaded jars are stored under their content hash, with an index from download URL to hash
+  def __init__(self, path):
+    self.path = path
+    self.index = os.path.join(path, 'index.json')
+    self.lock = threading.Lock()
+
+  def urls(self):
+    try:
+      with open(self.index) as f:
+        return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+      return {}
+
+  def get(self, url):
+    with self.lock:
+      digest = self.urls().get(url)
+    if digest and os.path.exists(jar := os.path.join(self.path, f'{digest}.jar')): return jar
+    return None
+
+  def put(self, url, stream):
+    # created on first use, so importing this module leaves the tree alone
+    os.makedirs(self.path, exist_ok=True)
+    sha = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=self.path, delete=False) as f:
+      while chunk := stream.read(1024 * 1024):
+        sha.update(chunk)
+        f.write(chunk)
+    jar = os.path.join(self.path, f'{sha.hexdigest()}.jar')
+    os.replace(f.name, jar)
+    with self.lock:
+      urls = self.urls()
+      urls[url] = sha.hexdigest()
+      with open(self.index + '.tmp', 'w') as f:
+        json.dump(urls, f, indent='  ', sort_keys=True)
+      os.replace(self.index + '.tmp', self.index)
+    return jar
+
+JARS = JarCache(os.path.join(root, '.cache', 'jars'))
+
 class fetch(object):
   def __init__(self, client):
     self.schema = os.path.join(SCHEMA.root, f'{client}.json')
@@ -66,7 +110,7 @@ class fetch(object):
         if not rel['version'] in releases
       ]
       releases = [rel for rel in releases if rel.startswith('5.')]
-      releases = sorted(releases, key=lambda r: [int(n) for n in r.replace('m', '.').split('.')])
+      releases = sorted(releases, key=release_key)
       self.update(
         client=client,
         releases=releases,
@@ -87,7 +131,7 @@ class fetch(object):
         if rel != '' and rel not in releases
       ]
       releases = [rel for rel in releases if rel.startswith('5.') and 'm' in rel and not 'beta' in rel]
-      releases = sorted(releases, key=lambda r: [int(n) for n in r.replace('m', '.').split('.')])
+      releases = sorted(releases, key=release_key)
       self.update(
         client=client,
         releases=releases,
@@ -129,52 +173,100 @@ class fetch(object):
 
     print('  updating', os.path.basename(self.schema))
 
-    for release in releases:
-      if release != current and release in hashes[client]: continue
-
-      with tempfile.NamedTemporaryFile() as tarball:
-        print('    downloading', download.format(version=release))
+    # ZOTERO_DOWNLOAD/JURISM_DOWNLOAD point the downloads elsewhere, e.g. a local stand-in
+    download = os.environ.get(f'{client.upper()}_DOWNLOAD', download)
+    pending = [release for release in releases if release == current or release not in hashes[client]]
+
+    # releases are fetched concurrently, but the schema files are written for the newest release only, as they would
+    # be if the releases were processed in order. The fetches log into a list per release, printed from here as each
+    # one completes, so their output doesn't interleave
+    fetched = {}
+    failed = []
+    logs = { release: [] for release in pending }
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('SCHEMA_FETCH_JOBS', '4'))) as pool:
+      jobs = { pool.submit(self.fetch, client, release, download, jarpath, schema, logs[release]): release for release in pending }
+      for job in as_completed(jobs):
+        release = jobs[job]
+        for message in logs[release]:
+          print(*message)
         try:
-          urlretrieve(download.format(version=release), tarball.name)
-
-          tar = tarfile.open(tarball.name, 'r:bz2')
-
-          jar = tar.getmember(jarpath)
-          print('      extracting', jar.name)
-          jar.name = os.path.basename(jar.name)
-          tar.extract(jar, path=os.path.dirname(tarball.name))
-
-          jar = zipfile.ZipFile(os.path.join(os.path.dirname(tarball.name), jar.name))
-          itt = fnmatch.filter(jar.namelist(), f'**/system-*-{client}.sql')
-          assert len(itt) <= 1, itt
-          if len(itt) == 1:
-            itt = itt[0]
-          else:
-            itt = fnmatch.filter(jar.namelist(), '**/system-*.sql')
-            assert len(itt) == 1, itt
-            itt = itt[0]
-          with jar.open(itt) as f, open(itemtypes, 'wb') as i:
-            i.write(f.read())
-          try:
-            with jar.open(schema) as f:
-              client_schema = json.load(f)
-              with open(self.schema, 'w') as f:
-                json.dump(client_schema, f, indent='  ')
-              hashes[client][release] = self.hash(client_schema)
-            print('      release', release, 'schema', client_schema['version'], 'hash', hashes[client][release])
-          except KeyError:
-            hashes[client][release] = None
-            print('      release', release, 'does not have a bundled schema')
-
-        except HTTPError as e:
-          if e.code in [ 403, 404 ]:
-            print('      release', release, 'not available')
-            hashes[client][release] = None
+          fetched[release] = job.result()
+        except Exception as e:
+          print('      release', release, 'failed:', e)
+          failed.append(release)
+          continue
+
+        hashes[client][release] = fetched[release].hash
+        if fetched[release].jar is None:
+          pass
+        elif fetched[release].schema is None:
+          print('      release', release, 'does not have a bundled schema')
+        else:
+          print('      release', release, 'schema', fetched[release].schema['version'], 'hash', fetched[release].hash)
+
+        # saved as releases come in, so a failed run picks up where it left off
+        hashes[client] = OrderedDict(sorted(hashes[client].items(), key=lambda rel: release_key(rel[0])))
+        with open(hashes_cache, 'w') as f:
+          json.dump(hashes, f, indent='  ')
+
+    if failed: raise ValueError(f'{client}: fetching {", ".join(sorted(failed, key=release_key))} failed')
+
+    written = Munch(itemtypes=False, schema=False)
+    for release in reversed(pending):
+      if fetched[release].jar is None: continue
+      if not written.itemtypes:
+        with open(itemtypes, 'wb') as f:
+          f.write(fetched[release].itemtypes)
+        written.itemtypes = True
+      if not written.schema and fetched[release].schema is not None:
+        with open(self.schema, 'w') as f:
+          json.dump(fetched[release].schema, f, indent='  ')
+        written.schema = True
+
+  def fetch(self, client, release, download, jarpath, schema, log):
+    url = download.format(version=release)
+    jar = JARS.get(url)
+    if jar is None:
+      log.append(('    downloading', url))
+      try:
+        # stream-decompress the tarball and keep only the jar, without the tarball or anything else touching the disk
+        with urlopen(url) as response, tarfile.open(fileobj=response, mode='r|bz2') as tar:
+          for member in tar:
+            if member.name == jarpath:
+              log.append(('      extracting', member.name))
+              jar = JARS.put(url, tar.extractfile(member))
+              break
           else:
-            raise e
-
-      with open(hashes_cache, 'w') as f:
-        json.dump(hashes, f, indent='  ')
+            raise KeyError(f'{jarpath} not found in {url}')
+      except HTTPError as e:
+        if e.code in [ 403, 404 ]:
+          log.append(('      release', release, 'not available'))
+          return Munch(hash=None, jar=None, schema=None)
+        raise e
+
+    with zipfile.ZipFile(jar) as jar:
+      itt = fnmatch.filter(jar.namelist(), f'**/system-*-{client}.sql')
+      assert len(itt) <= 1, itt
+      if len(itt) == 1:
+        itt = itt[0]
+      else:
+        itt = fnmatch.filter(jar.namelist(), '**/system-*.sql')
+        assert len(itt) == 1, itt
+        itt = itt[0]
+      with jar.open(itt) as f:
+        itemtypes = f.read()
+      try:
+        with jar.open(schema) as f:
+          client_schema = json.load(f)
+      except KeyError:
+        client_schema = None
+
+    return Munch(
+      hash=self.hash(client_schema) if client_schema is not None else None,
+      jar=jar.filename,
+      itemtypes=itemtypes,
+      schema=client_schema
+    )
 
   def __enter__(self):
     self.f = open(self.schema)
@@ -183,14 +275,6 @@ class fetch(object):
   def __exit__(self, type, value, traceback):
     self.f.close()
 
-class jsonpath:
-  finders = {}
-
-  @classmethod
-  def parse(cls, path):
-    if not path in cls.finders: cls.finders[path] = jsonpath_ng.parse(path)
-    return cls.finders[path]
-
 def patch(s, *ps):
   # field/type order doesn't matter for BBT
   for it in s['itemTypes']:
@@ -214,6 +298,33 @@ def patch(s, *ps):
       s = jsonpatch.apply_patch(s, json.load(f))
   return s
 
+def index(schema):
+  # one pass over a patched schema, producing the tables the generators below work from. Everything is kept in schema
+  # order, so the generated files come out the same as when they were built from the schema directly
+  tables = Munch(
+    itemTypes=[],
+    fields=[], # (itemType, field, baseField)
+    creatorTypes={},
+    fieldTypes={ field: meta.type for field, meta in schema.meta.fields.items() },
+    csl=Munch(
+      text=schema.csl.fields.get('text', {}),
+      date=schema.csl.fields.get('date', {}),
+      names=schema.csl.names,
+      unmapped=schema.csl.unmapped,
+      alias=schema.csl.alias,
+      types=list(schema.csl.get('types', {}).keys()),
+    ),
+    locales=[], # (field, label)
+  )
+  for itemType, meta in schema.itemTypes.items():
+    tables.itemTypes.append(meta.itemType)
+    tables.creatorTypes[itemType] = meta.creatorTypes
+    for field, baseField in meta.fields.items():
+      tables.fields.append((itemType, field, baseField))
+  for locale in schema.get('locales', {}).values():
+    tables.locales += list(locale.get('fields', {}).items())
+  return tables
+
 class ExtraFields:
   def __init__(self):
     self.changeid = 0
@@ -268,47 +379,42 @@ class ExtraFields:
       self.dg.add_node(node_id, domain=domain, name=name, type=type_, graphics={'h': 30.0, 'w': 7 * len(name), 'fill': self.color[domain]})
     self.dg.nodes[node_id][client] = True
 
-  def load(self, schema, client):
+  def load(self, tables, client):
     print('  loading', client)
-    typeof = {}
-    for field, meta in schema.meta.fields.items():
-      typeof[field] = meta.type
+    typeof = tables.fieldTypes
 
     # add nodes & edges
     baseFields = {}
-    for field, baseField in {str(f.path): f.value for f in jsonpath.parse('$.itemTypes.*.fields.*').find(schema)}.items():
+    for field, baseField in {field: baseField for _, field, baseField in tables.fields}.items():
       baseFields[field] = baseField
       self.add_var(domain='zotero', name=baseField, type_=typeof.get(baseField, 'text'), client=client)
 
-    for field in jsonpath.parse('$.itemTypes.*.creatorTypes[*]').find(schema):
-      self.add_var(domain='zotero', name=field.value, type_='name', client=client)
-
-    for fields in jsonpath.parse('$.csl.fields.text').find(schema):
-      for csl, zotero in fields.value.items():
-        self.add_var(domain='csl', name=csl, type_='text', client=client)
-        for field in zotero:
-          self.add_var(domain='zotero', name=field, type_='text', client=client)
-          self.add_mapping(from_=('csl', csl), to=('zotero', field))
-
-    for fields in jsonpath.parse('$.csl.fields.date').find(schema):
-      for csl, zotero in fields.value.items():
-        self.add_var(domain='csl', name=csl, type_='date', client=client)
-        if type(zotero) == str: zotero = [zotero] # juris-m has a list here, zotero strings
-        for field in zotero:
-          self.add_var(domain='zotero', name=field, type_='date', client=client)
-          self.add_mapping(from_=('csl', csl), to=('zotero', field))
-
-    for zotero, csl in schema.csl.names.items():
+    for creatorTypes in tables.creatorTypes.values():
+      for creatorType in creatorTypes:
+        self.add_var(domain='zotero', name=creatorType, type_='name', client=client)
+
+    for csl, zotero in tables.csl.text.items():
+      self.add_var(domain='csl', name=csl, type_='text', client=client)
+      for field in zotero:
+        self.add_var(domain='zotero', name=field, type_='text', client=client)
+        self.add_mapping(from_=('csl', csl), to=('zotero', field))
+
+    for csl, zotero in tables.csl.date.items():
+      self.add_var(domain='csl', name=csl, type_='date', client=client)
+      if type(zotero) == str: zotero = [zotero] # juris-m has a list here, zotero strings
+      for field in zotero:
+        self.add_var(domain='zotero', name=field, type_='date', client=client)
+        self.add_mapping(from_=('csl', csl), to=('zotero', field))
+
+    for zotero, csl in tables.csl.names.items():
       self.add_var(domain='csl', name=csl, type_='name', client=client)
       self.add_var(domain='zotero', name=zotero, type_='name', client=client)
       self.add_mapping(from_=('csl', csl), to=('zotero', zotero))
 
-    for field, type_ in schema.csl.unmapped.items():
+    for field, type_ in tables.csl.unmapped.items():
       if type_ != 'type': self.add_var(domain='csl', name=field, type_=type_, client=client)
 
-    for locale in jsonpath.parse('$.locales.*.fields.*').find(schema):
-      name = str(locale.path)
-      label = locale.value
+    for name, label in tables.locales:
       # no multiline fields
       if name in [ 'abstractNote', 'extra' ]: continue
       print(label, '=>', name)
@@ -318,15 +424,15 @@ class ExtraFields:
       if data['domain'] == 'label': continue # how is this possible?
       self.add_label(domain=data['domain'], name=data['name'], label=data['name'])
 
-    for field, baseField in {str(f.path): f.value for f in jsonpath.parse('$.itemTypes.*.fields.*').find(schema)}.items():
+    for field, baseField in {field: baseField for _, field, baseField in tables.fields}.items():
       if field == baseField: continue
       self.add_label(domain='zotero', name=baseField, label=field)
 
-    for alias, field in schema.csl.alias.items():
+    for alias, field in tables.csl.alias.items():
       self.add_label(domain='csl', name=field, label=alias)
 
     # translations
-    # for name, label in [(str(f.path), f.value) for f in jsonpath.parse('$.locales.*.fields.*').find(schema)]:
+    # for name, label in tables.locales:
     #   name = baseFields.get(name, name)
     #   if name in ['dateAdded', 'dateModified', 'itemType']: continue
     #   self.add_label(domain='zotero', name=name, label=label)
@@ -341,6 +447,20 @@ class ExtraFields:
     else:
       return ','.join(label.split(',') + [ str(change) ])
 
+  def hop_through(self, label):
+    # nodes exactly two live (not removed) edges away from the label, with the path that reaches them. Visits in the
+    # same order as a breadth-first shortest-path search, so the first intermediate node found is the one a shortest
+    # path would have taken
+    live = lambda u: [v for v, data in self.dg.succ[u].items() if not data.get('removed', False)]
+    seen = set([label] + live(label))
+    hops = []
+    for via in live(label):
+      for v in live(via):
+        if v in seen: continue
+        seen.add(v)
+        hops.append((v, [label, via, v]))
+    return hops
+
   def save(self):
     stringizer = lambda x: self.dg.nodes[x]['name'] if x in self.dg.nodes else x
 
@@ -350,7 +470,6 @@ class ExtraFields:
         self.dg.remove_node(node)
 
     # remove two or more incoming var edges, as that would incur overwrites (= data loss)
-    removed = set()
     for node, data in self.dg.nodes(data=True):
       incoming = reduce(lambda acc, edge: acc[self.dg.nodes[edge[0]]['domain']].append(edge) or acc, self.dg.in_edges(node), Munch(zotero=[], csl=[], label=[]))
       for domain, edges in incoming.items():
@@ -358,7 +477,6 @@ class ExtraFields:
 
         self.changeid += 1
         for edge in edges:
-          removed.add(edge)
           self.dg.edges[edge].update({
             'removed': True,
             'label': self.add_change(self.dg.edges[edge].get('label'), self.changeid),
@@ -372,14 +490,11 @@ class ExtraFields:
       for label, data in self.dg.nodes(data=True)
       if data['domain'] == 'label' and not re.search(r'[-_A-Z]', data['name']) # a label but not a shadow label
     }
-    for u, vs in dict(nx.all_pairs_dijkstra_path(self.dg, weight=lambda u, v, d: None if d.get('removed', False) else 1)).items():
-      # only interested in shortest paths that originate in a label
+    for u in list(self.dg.nodes):
       if not u in labels: continue
 
-      for v, path in vs.items():
-        if u == v: continue # no loops obviously
+      for v, path in self.hop_through(u):
         if self.dg.has_edge(u, v): continue # already in place
-        if len(path) != 3: continue # only consider one-step hop-through
 
         # TODO: label already has direct edge to the hop-through domain -- this entails fanning out the data unnecesarily
         if self.dg.nodes[v]['domain'] in labels[u]: continue
@@ -391,14 +506,6 @@ class ExtraFields:
           })
         self.dg.add_edge(u, v, label=str(self.changeid), added=True, graphics={ 'style': 'dashed', 'fill': self.color.added, 'targetArrow': 'standard' })
 
-    for u, vs in dict(nx.all_pairs_shortest_path(self.dg)).items():
-      if self.dg.nodes[u]['domain'] != 'label': continue
-      for v, path in vs.items():
-        # length of 3 means potential hop-through node
-        if u != v and len(path) == 3 and len(set(zip(path, path[1:])).intersection(removed)) > 0:
-          #print('removed', path)
-          pass
-
     #for i, sg in enumerate(nx.weakly_connected_components(self.dg)):
     #  nx.draw(self.dg.subgraph(sg), with_labels=True)
     #  plt.savefig(f'{i}.png')
@@ -488,6 +595,7 @@ with fetch('zotero') as z, fetch('jurism') as j:
 
   SCHEMA.zotero = Munch.fromDict(patch(json.load(z), 'schema.patch', 'zotero.patch'))
   SCHEMA.jurism = Munch.fromDict(patch(json.load(j), 'schema.patch', 'jurism.patch'))
+  INDEX = Munch(zotero=index(SCHEMA.zotero), jurism=index(SCHEMA.jurism))
 
   #with open('schema.json', 'w') as f:
   #  json.dump(SCHEMA.jurism, f, indent='  ')
@@ -495,14 +603,14 @@ with fetch('zotero') as z, fetch('jurism') as j:
   # test for inconsistent basefield mapping
   for schema in ['jurism', 'zotero']:
     fieldmap = {}
-    for field_path, field, baseField in [(str(f.full_path), str(f.path), f.value) for f in jsonpath.parse(f'$.itemTypes.*.fields.*').find(SCHEMA[schema])]:
+    for itemType, field, baseField in INDEX[schema].fields:
       if not field in fieldmap:
         fieldmap[field] = baseField
       else:
-        assert baseField == fieldmap[field], (schema, field_path, baseField, fieldmap[field])
+        assert baseField == fieldmap[field], (schema, f'itemTypes.{itemType}.fields.{field}', baseField, fieldmap[field])
 
-  ef.load(SCHEMA.jurism, 'jurism')
-  ef.load(SCHEMA.zotero, 'zotero')
+  ef.load(INDEX.jurism, 'jurism')
+  ef.load(INDEX.zotero, 'zotero')
   ef.save()
 
   with open(os.path.join(SCHEMA.root, 'hashes.json')) as f:
@@ -523,13 +631,13 @@ with fetch('zotero') as z, fetch('jurism') as j:
 
 print('  writing creators')
 creators = {'zotero': {}, 'jurism': {}}
-for creatorTypes in jsonpath.parse('*.itemTypes.*.creatorTypes').find(SCHEMA):
-  if len(creatorTypes.value) == 0: continue
-  client, itemType = operator.itemgetter(0, 2)(str(creatorTypes.full_path).split('.'))
+for client, tables in INDEX.items():
+  for itemType, creatorTypes in tables.creatorTypes.items():
+    if len(creatorTypes) == 0: continue
 
-  if not itemType in creators[client]: creators[client][itemType] = []
-  for creatorType in creatorTypes.value:
-    creators[client][itemType].append(creatorType)
+    if not itemType in creators[client]: creators[client][itemType] = []
+    for creatorType in creatorTypes:
+      creators[client][itemType].append(creatorType)
 with open(os.path.join(ITEMS, 'creators.json'), 'w') as f:
   json.dump(creators, f, indent='  ', default=lambda x: list(x))
 
@@ -538,17 +646,14 @@ def template(tmpl):
 
 print('  writing typing for serialized item')
 with open(os.path.join(TYPINGS, 'serialized-item.d.ts'), 'w') as f:
-  fields = sorted(list(set(field.value for field in jsonpath.parse('*.itemTypes.*.fields.*').find(SCHEMA))))
-  itemTypes = sorted(list(set(field.value for field in jsonpath.parse('*.itemTypes.*.itemType').find(SCHEMA))))
+  fields = sorted(list(set(baseField for tables in INDEX.values() for _, _, baseField in tables.fields)))
+  itemTypes = sorted(list(set(itemType for tables in INDEX.values() for itemType in tables.itemTypes)))
   print(template('items/serialized-item.d.ts.mako').render(fields=fields, itemTypes=itemTypes).strip(), file=f)
 
 print('  writing field simplifier')
 with open(os.path.join(ITEMS, 'items.ts'), 'w') as f:
   valid = Munch(type={}, field={})
-  for itemType in jsonpath.parse('*.itemTypes.*.itemType').find(SCHEMA):
-    client = str(itemType.full_path).split('.')[0]
-    itemType = itemType.value
-
+  for client, itemType in [(client, itemType) for client, tables in INDEX.items() for itemType in tables.itemTypes]:
     if not itemType in valid.type:
       valid.type[itemType] = client
       if itemType == 'note':
@@ -560,9 +665,8 @@ with open(os.path.join(ITEMS, 'items.ts'), 'w') as f:
     elif valid.type[itemType] != client:
       valid.type[itemType] = 'true'
 
-  for field in jsonpath.parse('*.itemTypes.*.fields.*').find(SCHEMA):
-    client, itemType = operator.itemgetter(0, 2)(str(field.full_path).split('.'))
-    for field in [str(field.path), field.value]:
+  for client, itemType, field, baseField in [(client, *field) for client, tables in INDEX.items() for field in tables.fields]:
+    for field in [field, baseField]:
       if not field in valid.field[itemType]:
         valid.field[itemType][field] = client
       elif valid.field[itemType][field] != client:
@@ -570,10 +674,7 @@ with open(os.path.join(ITEMS, 'items.ts'), 'w') as f:
 
   # map aliases to base names
   DG = nx.DiGraph()
-  for field in jsonpath.parse('*.itemTypes.*.fields.*').find(SCHEMA):
-    client = str(field.full_path).split('.')[0]
-    baseField = field.value
-    field = str(field.path)
+  for client, _, field, baseField in [(client, *field) for client, tables in INDEX.items() for field in tables.fields]:
     if field == baseField: continue
 
     if not (data := DG.get_edge_data(field, baseField, default=None)):
@@ -591,10 +692,7 @@ with open(os.path.join(ITEMS, 'items.ts'), 'w') as f:
   names.field['dateadded'] = Munch(jurism='dateAdded', zotero='dateAdded')
   names.field['datemodified'] = Munch(jurism='dateModified', zotero='dateModified')
   labels = {}
-  for field in jsonpath.parse('*.itemTypes.*.fields.*').find(SCHEMA):
-    client, itemType = operator.itemgetter(0, 2)(str(field.full_path).split('.'))
-    baseField = field.value
-    field = str(field.path)
+  for client, itemType, field, baseField in [(client, *field) for client, tables in INDEX.items() for field in tables.fields]:
     for section, field, name in [('field', field.lower(), baseField), ('field', baseField.lower(), baseField), ('type', itemType.lower(), itemType)]:
       if not field in names[section]:
         names[section][field] = Munch.fromDict({ client: name })
@@ -624,8 +722,8 @@ with open(os.path.join(ITEMS, 'items.ts'), 'w') as f:
 print('  writing csl-types')
 with open(os.path.join(ITEMS, 'csl-types.json'), 'w') as f:
   types = set()
-  for type_ in jsonpath.parse('*.csl.types.*').find(SCHEMA):
-    types.add(str(type_.full_path).split('.')[-1])
-  for type_ in jsonpath.parse('*.csl.unmapped.*').find(SCHEMA):
-    if type_.value == 'type': types.add(str(type_.full_path).split('.')[-1])
+  for tables in INDEX.values():
+    types.update(tables.csl.types)
+  for tables in INDEX.values():
+    types.update(field for field, type_ in tables.csl.unmapped.items() if type_ == 'type')
   json.dump(list(types), f)
@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 
-import shutil
 import os.path
 
 root = os.path.join(os.path.dirname(__file__), '..')
 
+# generated files are kept between runs so setup.py can skip steps whose outputs are current; setup.py prunes what
+# the steps don't generate, and setup.py --clean starts from scratch
 print('make build dirs')
 for d in ['build', 'build/resource/abbrev', 'build/resource/jieba', 'build/resource/unabbrev', 'gen', 'gen/typings', 'xpi']:
-  print('  creating', d)
-  d = os.path.join(root, d)
-  if os.path.isdir(d): shutil.rmtree(d)
-  os.makedirs(d, exist_ok=True)
+  os.makedirs(os.path.join(root, d), exist_ok=True)
@@ -1,14 +1,167 @@
 #!/usr/bin/env python3
 
+# The generators run as a build graph. Each step declares its inputs and outputs; a step is skipped when neither
+# changed since its last successful run (by path, size and mtime), and steps whose dependencies are done run in
+# parallel. Steps that fetch from the network have no meaningful local inputs, so they are refreshed once a day, or
+# on --refresh.
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import os
+import runpy
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from types import SimpleNamespace
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# several generators use paths relative to the repo root
+os.chdir(root)
+
+STATE = '.cache/setup.json'
+DAY = 24 * 60 * 60
+
+def step(name, inputs=[], outputs=[], deps=[], ttl=None):
+  return SimpleNamespace(name=name, script=f'setup/{name}.py', inputs=[f'setup/{name}.py'] + inputs, outputs=outputs, deps=deps, ttl=ttl)
+
+STEPS = [
+  step('preferences',
+    inputs=['setup/preferences.js', 'content/*.pug', 'content/Preferences/*.pug', 'content/*.xul', 'locale/en-US/zotero-better-bibtex.dtd', 'translators/*.json', 'setup/templates/preferences/*', 'site/content/installation/preferences/*.md'],
+    outputs=['gen/preferences.ts', 'gen/preferences/meta.ts', 'build/defaults/preferences/defaults.js', 'test/features/steps/preferences.json', 'site/data/preferences/defaults.json'],
+  ),
+  step('translators', inputs=['translators/*.json'], outputs=['gen/translators.json']),
+  step('submodules', inputs=['.gitmodules'], ttl=DAY),
+  step('months', inputs=['submodules/citation-style-language-locales/locales-*.xml'], outputs=['gen/dateparser-months.json'], deps=['submodules']),
+  step('kuroshiro', inputs=['node_modules/kuromoji/dict/*.gz'], outputs=['build/resource/kuromoji/*']),
+  step('item',
+    inputs=['.env', 'schema/*.json', 'schema/*.patch', 'setup/templates/items/*'],
+    outputs=['gen/items/*', 'gen/typings/serialized-item.d.ts', 'site/layouts/shortcodes/extra-fields.md'],
+    ttl=DAY,
+  ),
+  step('bibertool', outputs=['translators/bibtex/biber-tool.conf'], ttl=DAY),
+  step('abbrev', inputs=['node_modules/@retorquere/bibtex-parser/unabbrev.json', 'node_modules/@retorquere/bibtex-parser/strings.bib'], outputs=['build/resource/unabbrev/*']),
+  step('jieba', inputs=['node_modules/ooooevan-jieba/dict/*'], outputs=['build/resource/ooooevan-jieba/dict/*']),
+  step('babel', inputs=['submodules/babel/locale/**/*.ini', 'submodules/biblatex/tex/latex/biblatex/lbx/*.lbx'], outputs=['gen/babel/*.json'], deps=['submodules']),
+  step('scannablecite', inputs=['submodules/zotero-odf-scan-plugin/resource/translators/Scannable Cite.js', 'setup/templates/Scannable Cite.mako'], outputs=['gen/ScannableCite.ts'], deps=['submodules']),
+]
+
+def fingerprint(patterns, required=False):
+  # for outputs, a pattern that matches nothing yields None, so a missing output always counts as a change
+  digest = hashlib.sha256()
+  for pattern in patterns:
+    paths = sorted(glob.glob(pattern, recursive=True))
+    if required and not paths: return None
+    for path in paths:
+      if not os.path.isfile(path): continue
+      st = os.stat(path)
+      digest.update(f'{path}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8'))
+  return digest.hexdigest()
+
+def run(script):
+  # runs in a worker; output is collected so the logs of parallel steps don't interleave
+  output = io.StringIO()
+  started = time.time()
+  ok = True
+  with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+    try:
+      runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+      ok = e.code in [None, 0]
+    except Exception:
+      traceback.print_exc()
+      ok = False
+  return ok, output.getvalue(), time.time() - started
+
+parser = argparse.ArgumentParser(description='generate sources and resources')
+parser.add_argument('--force', action='store_true', help='run all steps')
+parser.add_argument('--refresh', action='store_true', help='run the steps that fetch from the network')
+parser.add_argument('--clean', action='store_true', help='remove build, gen and xpi first; implies --force')
+parser.add_argument('--jobs', type=int, default=os.cpu_count())
+args = parser.parse_args()
+
+if args.clean:
+  for d in ['build', 'gen', 'xpi']:
+    if os.path.isdir(d): shutil.rmtree(d)
+  args.force = True
+
+def prune():
+  # the build/ outputs of the steps are kept for incremental runs; anything else in build/, and the xpis, are left over
+  # from earlier builds and would otherwise be packaged or installed next to the current build
+  tracked = set()
+  for s in STEPS:
+    for pattern in s.outputs:
+      if pattern.startswith('build/'): tracked.update(glob.glob(pattern, recursive=True))
+  for xpi in glob.glob('xpi/*.xpi'):
+    os.remove(xpi)
+  for path in sorted(glob.glob('build/**/*', recursive=True), reverse=True):
+    if os.path.isfile(path) and path not in tracked:
+      os.remove(path)
+    elif os.path.isdir(path) and not os.listdir(path):
+      os.rmdir(path)
+
+prune()
 import makedirs
-import preferences
-import translators
-import submodules
-import months
-import kuroshiro
-import item
-import bibertool
-import abbrev
-import jieba
-import babel
-import scannablecite
+
+state = {}
+if os.path.exists(STATE) and not args.force:
+  with open(STATE) as f:
+    state = json.load(f)
+
+def save():
+  os.makedirs(os.path.dirname(STATE), exist_ok=True)
+  with open(STATE + '.tmp', 'w') as f:
+    json.dump(state, f, indent='  ', sort_keys=True)
+  os.replace(STATE + '.tmp', STATE)
+
+def stale(s):
+  if not (last := state.get(s.name)): return True
+  if s.ttl and (args.refresh or time.time() - last['ran'] > s.ttl): return True
+  return last['inputs'] != fingerprint(s.inputs) or last['outputs'] != fingerprint(s.outputs, required=True)
+
+pending = { s.name: s for s in STEPS }
+done = set()
+failed = set()
+running = {}
+started = time.time()
+executor = None
+while pending or running:
+  for s in list(pending.values()):
+    if any(dep in failed for dep in s.deps):
+      print(f'{s.name}: skipped, a dependency failed')
+      failed.add(s.name)
+      del pending[s.name]
+    elif all(dep in done for dep in s.deps):
+      del pending[s.name]
+      if not stale(s):
+        print(f'{s.name}: up to date')
+        done.add(s.name)
+        continue
+      # only start the pool when there is work to do, that keeps a no-op run fast
+      executor = executor or ProcessPoolExecutor(max_workers=args.jobs)
+      running[executor.submit(run, s.script)] = s
+  if not running: continue
+
+  finished, _ = wait(running, return_when=FIRST_COMPLETED)
+  for future in finished:
+    s = running.pop(future)
+    ok, output, secs = future.result()
+    print(f'{s.name} ({secs:.1f}s){"" if ok else " failed"}')
+    if output.strip(): print(output.rstrip())
+    if ok:
+      done.add(s.name)
+      # fingerprints are taken after the run, as some steps rewrite their own inputs
+      state[s.name] = { 'ran': time.time(), 'inputs': fingerprint(s.inputs), 'outputs': fingerprint(s.outputs, required=True) }
+    else:
+      failed.add(s.name)
+      state.pop(s.name, None)
+    save()
+
+if executor: executor.shutdown()
+print(f'setup: {len(STEPS) - len(failed)} steps ok, {len(failed)} failed, {time.time() - started:.1f}s')
+if failed: sys.exit(1)
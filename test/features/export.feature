@@ -352,7 +352,7 @@ Scenario: Postfixed keys different between computers #1788
   When I import 2 references from "export/*.json"
   And I select the item with a field that contains "Wittgenstein"
   And I pin the citation key to "heyns2021"
-  And I wait 2 seconds
+  And I wait until the citation keys are settled
   Then an export using "Better BibLaTeX" should match "export/*.biblatex"
 
 @arXiv @85 @bbt
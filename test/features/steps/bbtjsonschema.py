@@ -5,10 +5,48 @@ import glob
 from munch import Munch
 import os
 import jsonschema
+import hashlib
 
 root = os.path.join(os.path.dirname(__file__), '../../..')
 
 baseline = __file__.replace('.py', '.json')
+inputs = [
+  os.path.join(root, 'translators', '*.json'),
+  os.path.join(os.path.dirname(__file__), 'preferences.json'),
+  os.path.join(root, 'schema', '*.json'),
+]
+state = os.path.join(root, '.cache', 'bbtjsonschema.json')
+
+def sha256(path):
+  with open(path, 'rb') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+def fingerprint():
+  return hashlib.sha256(json.dumps([
+    [os.path.relpath(path, root), sha256(path)]
+    for pattern in inputs
+    for path in sorted(glob.glob(pattern))
+  ]).encode('utf-8')).hexdigest()
+
+def load():
+  # the generated schema can be reused as-is when neither its inputs nor the baseline itself changed since it was built
+  try:
+    with open(state) as f:
+      built = json.load(f)
+  except (FileNotFoundError, json.JSONDecodeError):
+    built = {}
+
+  current = fingerprint()
+  if built.get('inputs') == current and built.get('output') == sha256(baseline):
+    with open(baseline) as f:
+      return json.load(f)
+
+  schema = refresh()
+  os.makedirs(os.path.dirname(state), exist_ok=True)
+  with open(state, 'w') as f:
+    json.dump({ 'inputs': current, 'output': sha256(baseline) }, f)
+  return schema
+
 def refresh():
   with open(baseline) as f:
     schema = Munch.fromDict(json.load(f))
@@ -70,6 +108,22 @@ def refresh():
 
   return Munch.toDict(schema)
 
-schema = refresh()
+schema = load()
+digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()
+
+# build the validator once; no format checker is attached, so format checks are off
+Validator = jsonschema.validators.validator_for(schema)
+Validator.check_schema(schema)
+validator = Validator(schema)
+
 def validate(lib):
-  jsonschema.validate(instance=lib, schema=schema)
+  # stop at the first error rather than collecting them all
+  for error in validator.iter_errors(lib):
+    raise error
+
+# items on their own, for libraries that are validated while they're streamed
+item_validator = Validator(schema['properties']['items']['items'])
+
+def validate_item(item):
+  for error in item_validator.iter_errors(item):
+    raise error
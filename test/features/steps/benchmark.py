@@ -0,0 +1,151 @@
+import math
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# export throughput measurements over the debug bridge, and latency of the pull-export endpoints over HTTP;
+# test/benchmark is the command line front-end
+
+def percentile(values, p):
+  # nearest-rank, same as util/timings.py
+  values = sorted(values)
+  return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def key(case):
+  return f"{case['translator']} | {case['items']} items | {case['cache']} cache | workers {'on' if case['workers'] else 'off'}"
+
+class Benchmark:
+  def __init__(self, zotero, runs):
+    self.zotero = zotero
+    self.runs = runs
+
+  def load(self, path):
+    self.zotero.reset()
+    return self.zotero.execute('return await Zotero.BetterBibTeX.TestSupport.importFile(path, false)', path=path)
+
+  def export(self, translatorID, output):
+    # server-side latency, so bridge overhead and the transfer of large exports stay out of the numbers
+    return self.zotero.execute('''
+      const started = Date.now();
+      await Zotero.BetterBibTeX.TestSupport.exportLibrary(translatorID, { Normalize: true }, output, null);
+      return Date.now() - started;
+    ''', translatorID=translatorID, output=output) / 1000
+
+  def measure(self, translator, items, cache, workers, output):
+    self.zotero.preferences['.workers'] = workers
+    translatorID = self.zotero.translators.byName[translator].translatorID
+
+    # warm runs start from a primed cache, cold runs drop it before every export
+    if cache == 'warm': self.export(translatorID, output)
+    secs = []
+    for _ in range(self.runs):
+      if cache == 'cold': self.zotero.reset_cache()
+      secs.append(self.export(translatorID, output))
+
+    p50 = percentile(secs, 50)
+    return {
+      'translator': translator,
+      'items': items,
+      'cache': cache,
+      'workers': workers,
+      'runs': self.runs,
+      'p50': p50,
+      'p95': percentile(secs, 95),
+      'max': max(secs),
+      'items_per_sec': items / p50 if p50 else None,
+    }
+
+class PullExport(Benchmark):
+  # what a build server sees: a full HTTP round-trip to the pull-export endpoints per export
+  def __init__(self, zotero, runs, selected=50):
+    super().__init__(zotero, runs)
+    self.selected = selected
+
+  def load(self, path):
+    items = super().load(path)
+    # the fullest collection, and a selection the size of a typical document's references
+    self.collection = self.zotero.execute('''
+      const collections = Zotero.Collections.getByLibrary(Zotero.Libraries.userLibraryID, true)
+      if (!collections.length) return null
+      const collection = collections.sort((a, b) => b.getChildItems(true).length - a.getChildItems(true).length)[0]
+      return { key: collection.key, items: collection.getChildItems(true).length }
+    ''')
+    ids = self.zotero.execute('''
+      const items = await Zotero.Items.getAll(Zotero.Libraries.userLibraryID, true, false, true)
+      return items.slice(0, n)
+    ''', n=self.selected)
+    self.zotero.execute('await Zotero.BetterBibTeX.TestSupport.select(ids)', ids=ids)
+    self.items = { 'library': items, 'collection': self.collection['items'] if self.collection else 0, 'selected': len(ids) }
+    return items
+
+  def url(self, endpoint, translator, options):
+    if endpoint == 'library':
+      query = f'/library.{translator}'
+    elif endpoint == 'collection':
+      query = f"/{self.collection['key']}.{translator}"
+    else:
+      query = translator
+    return f'http://127.0.0.1:{self.zotero.port}/better-bibtex/export/{endpoint}?{urllib.parse.quote(query, safe="/.")}' + (f'&{options}' if options else '')
+
+  def fetch(self, url):
+    # an endpoint that answers with an error or drops the connection makes a failed sample rather than end the run
+    started = time.time()
+    try:
+      with urllib.request.urlopen(url, timeout=self.zotero.config.timeout) as response:
+        response.read()
+      error = None
+    except urllib.error.HTTPError as e:
+      error = f'HTTP {e.code}: {e.read().decode("utf-8", "replace").strip()[:200]}'
+    except (urllib.error.URLError, OSError) as e:
+      # refused, reset or timed out
+      error = type(e).__name__
+    return time.time() - started, error
+
+  def measure(self, endpoint, translator, options, cache):
+    assert endpoint != 'collection' or self.collection, 'the library has no collections'
+    url = self.url(endpoint, translator, options)
+
+    # warm runs start from a primed cache, cold runs drop it before every export
+    if cache == 'warm': self.fetch(url)
+    secs = []
+    errors = {}
+    for _ in range(self.runs):
+      if cache == 'cold': self.zotero.reset_cache()
+      sec, error = self.fetch(url)
+      if error is None:
+        secs.append(sec)
+      else:
+        errors[error] = errors.get(error, 0) + 1
+
+    return {
+      'endpoint': endpoint,
+      'translator': translator,
+      'options': options,
+      'items': self.items[endpoint],
+      'cache': cache,
+      'runs': self.runs,
+      'errors': errors,
+      'p50': percentile(secs, 50) if secs else None,
+      'p95': percentile(secs, 95) if secs else None,
+      'max': max(secs) if secs else None,
+    }
+
+def pull_key(case):
+  return f"{case['endpoint']} | {case['translator']} | {case['items']} items | {case['options'] or 'default options'} | {case['cache']} cache"
+
+def compare(results, baseline, threshold, key=key):
+  # a case regresses when it fails more often than in the baseline, or when its throughput (where measured) drops or
+  # its p95 latency grows by more than threshold percent
+  baseline = { key(case): case for case in baseline }
+  regressions = []
+  for case in results:
+    base = baseline.get(key(case), {})
+    if (failed := sum(case.get('errors', {}).values())) > sum(base.get('errors', {}).values()):
+      regressions.append(f"{key(case)}: {failed} of {case['runs']} requests failed: {', '.join(case['errors'])}")
+    if not base or case['p95'] is None or base['p95'] is None: continue
+    if base.get('items_per_sec') and case['items_per_sec'] < base['items_per_sec'] * (1 - threshold / 100):
+      regressions.append(f"{key(case)}: {base['items_per_sec']:.0f} -> {case['items_per_sec']:.0f} items/sec")
+    if case['p95'] > base['p95'] * (1 + threshold / 100):
+      regressions.append(f"{key(case)}: p95 {base['p95']:.2f}s -> {case['p95']:.2f}s")
+  return regressions
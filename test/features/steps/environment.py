@@ -1,4 +1,5 @@
 from steps.zotero import Zotero
+from steps.timings import MemoryTimeline
 from behave.contrib.scenario_autoretry import patch_scenario_with_autoretry
 from behave.tag_matcher import ActiveTagMatcher, setup_active_tag_values
 import re
@@ -7,8 +8,10 @@ import urllib.request
 from munch import *
 import os
 import steps.utils as utils
+import steps.parallel as parallel
 import sys
 import json
+import zlib
 
 active_tag_value_provider = {
   'client': 'zotero',
@@ -22,6 +25,10 @@ def before_feature(context, feature):
   if active_tag_matcher.should_exclude_with(feature.tags):
     feature.skip(reason="DISABLED ACTIVE-TAG")
 
+  if context.coordinator:
+    # longest first, so the stragglers at the end of a parallel run are short
+    feature.scenarios.sort(key=lambda scenario: parallel.duration(balance, scenario.name), reverse=True)
+
   for scenario in feature.walk_scenarios():
     retries = 0
     for tag in scenario.effective_tags:
@@ -34,7 +41,19 @@ def before_feature(context, feature):
 def before_all(context):
   context.memory = Munch(total=None, increase=None)
   context.zotero = Zotero(context.config.userdata)
+  if every := context.config.userdata.get('memory_timeline'):
+    context.memory_timeline = MemoryTimeline(context.zotero, float(every))
+  else:
+    context.memory_timeline = None
+  if coordinator := context.config.userdata.get('coordinator'):
+    context.coordinator = parallel.connect(coordinator, os.environ['BBT_COORDINATOR_AUTHKEY'])
+  else:
+    context.coordinator = None
   setup_active_tag_values(active_tag_value_provider, context.config.userdata)
+  if 'bin' in context.config.userdata:
+    global bins, this_bin
+    this_bin, bins = parallel.parse_bin(context.config.userdata['bin'])
+    assert 1 <= this_bin <= bins, f"bin {context.config.userdata['bin']} out of range"
   # test whether the existing references, if any, have gotten a cite key
   context.zotero.export_library(translator = 'Better BibTeX')
 
@@ -44,23 +63,35 @@ try:
 except FileNotFoundError:
   balance = None
 
+bins = this_bin = None
+def scenario_bin(name):
+  name = re.sub(r' -- @[0-9]+\.[0-9]+ ', '', name)
+  schedule = balance['slow' if active_tag_value_provider['slow'] == 'true' else 'fast'].get(str(bins))
+  assert schedule is not None, f'test/balance.json has no schedule for {bins} bins, run util/rebalance.py with --bins {bins}'
+  for test_bin, tests in schedule.items():
+    if name in tests: return int(test_bin)
+  # not scheduled yet, spread new tests deterministically
+  return zlib.crc32(name.encode('utf-8')) % bins + 1
+
 def before_scenario(context, scenario):
   if active_tag_matcher.should_exclude_with(scenario.effective_tags):
     scenario.skip(f"DISABLED ACTIVE-TAG {str(active_tag_value_provider)}")
     return
   if balance is not None and 'bin' in context.config.userdata:
-    if re.sub(r' -- @[0-9]+\.[0-9]+ ', '', scenario.name) in balance['slow' if active_tag_value_provider['slow'] == 'true' else 'fast']['1']:
-      test_bin = '1'
-    else:
-      test_bin = '2'
-    if context.config.userdata['bin'] != test_bin:
-      scenario.skip(f'TESTED IN BIN {test_bin}')
+    test_bin = scenario_bin(scenario.name)
+    if test_bin != this_bin:
+      scenario.skip(f'TESTED IN BIN {test_bin}/{bins}')
       return
   if 'test' in context.config.userdata and not any(test in scenario.name.lower() for test in context.config.userdata['test'].lower().split(',')):
     scenario.skip(f"ONLY TESTING SCENARIOS WITH {context.config.userdata['test']}")
+    return
+  if context.coordinator and not context.coordinator.claim(scenario.name, context.zotero.worker):
+    scenario.skip('TESTED BY ANOTHER WORKER')
+    return
 
-  context.zotero.reset()
-  context.zotero.execute('Zotero.BetterBibTeX.TestSupport.scenario = scenario', scenario=scenario.name)
+  if context.zotero.timings: context.zotero.timings.scenario = scenario.name
+  context.zotero.reset(scenario.name)
+  if context.memory_timeline: context.memory_timeline.start()
   context.displayOptions = {}
   context.selected = []
   context.imported = None
@@ -76,7 +107,20 @@ def before_scenario(context, scenario):
       context.timeout = max(context.timeout, int(tag.split('=')[1]))
   context.zotero.config.timeout = context.timeout
 
+def before_step(context, step):
+  if context.zotero.timings: context.zotero.timings.step = step.name
+
+def after_step(context, step):
+  if context.zotero.timings: context.zotero.timings.record_step(step)
+
 def after_scenario(context, scenario):
+  if context.coordinator: context.coordinator.finish(scenario.name, context.zotero.worker)
+  if context.memory_timeline: context.memory_timeline.finish(scenario.name)
+  if context.zotero.timings:
+    context.zotero.timings.step = None
+    if scenario.status.name == 'passed': context.zotero.record_cache()
+    context.zotero.timings.commit()
+
   if context.memory.increase or context.memory.total:
     memory = Munch.fromDict(context.zotero.execute('return Zotero.BetterBibTeX.TestSupport.memoryState("behave cap")'))
     if context.memory.increase and memory.delta > context.memory.increase:
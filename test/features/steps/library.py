@@ -1,5 +1,5 @@
 import json
-from copy import deepcopy
+from copy import copy
 from steps.utils import html2md, HashableDict, print
 import steps.utils as utils
 
@@ -8,13 +8,13 @@ def unnest(obj, key):
   return obj[key]
   
 def un_multi(obj):
+  # returns a copy rather than stripping in place, so items need not be deep-copied up front
   if type(obj) == dict:
-    obj.pop('multi', None)
-    for v in obj.values():
-      un_multi(v)
+    return {k: un_multi(v) for k, v in obj.items() if k != 'multi'}
   elif type(obj) == list:
-    for v in obj:
-      un_multi(v)
+    return [un_multi(v) for v in obj]
+  else:
+    return obj
 
 def strip_obj(data):
   if type(data) == list:
@@ -32,9 +32,8 @@ def strip_obj(data):
     return data
 
 def clean_item(item):
-  item = deepcopy(item)
-
-  un_multi(item)
+  # everything below either pops top-level keys or replaces values, so a shallow copy protects the original
+  item = copy(un_multi(item))
 
   item.pop('itemID', None)
   item.pop('version', None)
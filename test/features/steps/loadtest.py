@@ -0,0 +1,179 @@
+import asyncio
+import json
+import random
+import time
+from steps.benchmark import percentile
+
+# replays a weighted mix of JSON-RPC calls against /better-bibtex/json-rpc at a fixed rate, the way editor
+# integrations use it; test/loadtest is the command line front-end
+
+MIX = { 'item.search': 4, 'item.citationkey': 4, 'item.bibliography': 1, 'item.export': 1, 'autoexport.add': 0 }
+# upper bounds of the latency histogram buckets, in ms
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+def mix(spec):
+  # 'item.search=4,item.export=1'; methods not mentioned are left out
+  weights = {}
+  for part in spec.split(','):
+    method, _, weight = part.partition('=')
+    assert method in MIX, f'unsupported method {method}'
+    weights[method] = float(weight or 1)
+  return weights
+
+class Connection:
+  # minimal HTTP/1.1 client on asyncio streams that keeps the connection open when the server allows it
+  def __init__(self, port):
+    self.port = port
+    self.reader = self.writer = None
+
+  def close(self):
+    if self.writer: self.writer.close()
+    self.reader = self.writer = None
+
+  async def post(self, path, body):
+    while True:
+      reused = self.writer is not None
+      if not reused: self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+      try:
+        return await self.request(path, body)
+      except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+        self.close()
+        # the server dropped an idle keep-alive connection; retry on a fresh one
+        if not reused: raise
+      except:
+        self.close()
+        raise
+
+  async def request(self, path, body):
+    self.writer.write(f'POST {path} HTTP/1.1\r\nHost: 127.0.0.1:{self.port}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n'.encode('ascii') + body)
+    await self.writer.drain()
+
+    status = int((await self.reader.readuntil(b'\r\n')).split(b' ')[1])
+    headers = {}
+    while (line := await self.reader.readuntil(b'\r\n')) != b'\r\n':
+      name, _, value = line.decode('latin-1').partition(':')
+      headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+      body = await self.reader.readexactly(int(headers['content-length']))
+    else:
+      body = await self.reader.read()
+      headers['connection'] = 'close'
+    if headers.get('connection', '').lower() == 'close': self.close()
+    return status, body
+
+class Stats:
+  def __init__(self):
+    self.latencies = []
+    self.errors = {}
+
+  def add(self, latency, error=None):
+    self.latencies.append(latency)
+    if error is not None: self.errors[error] = self.errors.get(error, 0) + 1
+
+  def report(self, duration):
+    calls = len(self.latencies)
+    errors = sum(self.errors.values())
+    ms = [latency * 1000 for latency in self.latencies]
+    histogram = { f'<={bucket}ms': 0 for bucket in BUCKETS }
+    histogram[f'>{BUCKETS[-1]}ms'] = 0
+    for latency in ms:
+      bucket = next((f'<={bucket}ms' for bucket in BUCKETS if latency <= bucket), f'>{BUCKETS[-1]}ms')
+      histogram[bucket] += 1
+    return {
+      'calls': calls,
+      'throughput': calls / duration if duration else None,
+      'error_rate': errors / calls if calls else 0,
+      'errors': self.errors,
+      'p50': percentile(ms, 50) if ms else None,
+      'p90': percentile(ms, 90) if ms else None,
+      'p99': percentile(ms, 99) if ms else None,
+      'max': max(ms) if ms else None,
+      'histogram': histogram,
+    }
+
+class LoadTest:
+  def __init__(self, port, library, weights, seed=0, output=None):
+    # library: [{ citekey, itemKey, libraryID }], as fetched by test/loadtest before the run
+    assert library, 'the library is empty'
+    self.port = port
+    self.library = library
+    self.methods = list(weights)
+    self.weights = [weights[method] for method in self.methods]
+    self.random = random.Random(seed)
+    self.output = output
+    self.ids = 0
+
+  def sample(self, n):
+    return self.random.sample(self.library, min(n, len(self.library)))
+
+  def call(self):
+    method = self.random.choices(self.methods, weights=self.weights)[0]
+    r = self.random
+    if method == 'item.search':
+      # the leading letters of a citekey, the way an editor completes as you type
+      citekey = r.choice(self.library)['citekey']
+      params = [citekey[:r.randint(2, max(2, min(6, len(citekey))))]]
+    elif method == 'item.citationkey':
+      params = [[f"{item['libraryID']}:{item['itemKey']}" for item in self.sample(r.randint(1, 5))]]
+    elif method == 'item.bibliography':
+      params = [[item['citekey'] for item in self.sample(r.randint(1, 5))], { 'id': 'apa' }]
+    elif method == 'item.export':
+      params = [[item['citekey'] for item in self.sample(r.randint(1, 20))], 'Better BibTeX']
+    elif method == 'autoexport.add':
+      params = ['//loadtest', 'Better BibTeX', self.output, {}, True]
+    self.ids += 1
+    return { 'jsonrpc': '2.0', 'method': method, 'params': params, 'id': self.ids }
+
+  async def send(self, pool, calls, scheduled, stats):
+    # latency counts from when the call was due rather than when a connection came free, so a backed-up server
+    # shows up in the numbers instead of slowing down the generator
+    body = json.dumps(calls[0] if len(calls) == 1 else calls).encode('utf-8')
+    conn = await pool.get()
+    try:
+      status, response = await conn.post('/better-bibtex/json-rpc', body)
+      latency = time.monotonic() - scheduled
+      if status != 200:
+        for call in calls: stats[call['method']].add(latency, f'HTTP {status}')
+        return
+      response = json.loads(response)
+      if type(response) != list: response = [response]
+      # results are matched up by id; errors for calls the server couldn't identify come back with id null and go to
+      # the calls left over, in order. A call without a result counts as failed
+      results = { result['id']: result for result in response if result.get('id') is not None }
+      anonymous = [result for result in response if result.get('id') is None]
+      for call in calls:
+        result = results.pop(call['id'], None) or (anonymous.pop(0) if anonymous else None)
+        if result is None:
+          stats[call['method']].add(latency, 'no response')
+        else:
+          stats[call['method']].add(latency, f"{result['error']['code']}" if 'error' in result else None)
+    except Exception as e:
+      latency = time.monotonic() - scheduled
+      for call in calls: stats[call['method']].add(latency, type(e).__name__)
+    finally:
+      pool.put_nowait(conn)
+
+  async def run(self, rate, duration, connections=4, batch=1):
+    # rate is in calls per second; with batch > 1 that many calls go out together as a JSON-RPC batch array
+    pool = asyncio.Queue()
+    for _ in range(connections):
+      pool.put_nowait(Connection(self.port))
+    stats = { method: Stats() for method in self.methods }
+
+    started = time.monotonic()
+    pending = set()
+    n = 0
+    while (scheduled := started + n * batch / rate) < started + duration:
+      await asyncio.sleep(max(0, scheduled - time.monotonic()))
+      task = asyncio.create_task(self.send(pool, [self.call() for _ in range(batch)], scheduled, stats))
+      pending.add(task)
+      task.add_done_callback(pending.discard)
+      n += 1
+    await asyncio.gather(*pending)
+    elapsed = time.monotonic() - started
+
+    while not pool.empty():
+      pool.get_nowait().close()
+
+    return { method: s.report(elapsed) for method, s in stats.items() }
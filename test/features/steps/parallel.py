@@ -0,0 +1,65 @@
+from multiprocessing.managers import BaseManager
+import threading
+import secrets
+import re
+
+# the coordinator hands out scenarios to whichever worker asks first; every worker walks the full suite and skips
+# what it could not claim. Claimed scenarios are marked finished when they end, so the scenarios of a worker that died
+# halfway can be reported; by then the other workers are past them, so they fail the run rather than go back out
+
+class Claims:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.claimed = {}
+    self.finished = set()
+
+  def claim(self, scenario, worker):
+    with self.lock:
+      # a retried scenario is re-claimed by the worker that already owns it
+      return self.claimed.setdefault(scenario, worker) == worker
+
+  def finish(self, scenario, worker):
+    with self.lock:
+      if self.claimed.get(scenario) == worker: self.finished.add(scenario)
+
+  def unfinished(self):
+    with self.lock:
+      return { scenario: worker for scenario, worker in self.claimed.items() if scenario not in self.finished }
+
+  def summary(self):
+    with self.lock:
+      return dict(self.claimed)
+
+class Coordinator(BaseManager):
+  pass
+
+def serve():
+  claims = Claims()
+  Coordinator.register('claims', callable=lambda: claims)
+  authkey = secrets.token_hex(16)
+  server = Coordinator(address=('127.0.0.1', 0), authkey=authkey.encode('ascii')).get_server()
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  host, port = server.address
+  return f'{host}:{port}', authkey, claims
+
+def connect(address, authkey):
+  Coordinator.register('claims')
+  host, port = address.split(':')
+  coordinator = Coordinator(address=(host, int(port)), authkey=authkey.encode('ascii'))
+  coordinator.connect()
+  return coordinator.claims()
+
+def parse_bin(value):
+  # "k/N", or plain "k" for the original two-bin split
+  if '/' in value:
+    k, n = value.split('/')
+  else:
+    k, n = value, '2'
+  return int(k), int(n)
+
+def duration(balance, name):
+  if balance is None: return 0
+  name = re.sub(r' -- @[0-9]+\.[0-9]+ ', '', name)
+  msecs = balance['duration'].get(name, 0)
+  if type(msecs) == dict: msecs = msecs['msecs']
+  return msecs
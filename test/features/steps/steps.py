@@ -9,6 +9,7 @@ import os
 from hamcrest import assert_that, equal_to
 from steps.utils import assert_equal_diff, expand_scenario_variables
 import steps.utils as utils
+import steps.synthetic as synthetic
 import steps.zotero as zotero
 import glob
 
@@ -47,6 +48,7 @@ with step_matcher('re'):
 @given(u'I set the temp directory to {value}')
 def step_impl(context, value):
   context.tmpDir = os.path.join(ROOT, json.loads(value))
+  if context.zotero.worker: context.tmpDir += f'-{context.zotero.worker}'
   if os.path.isdir(context.tmpDir):
     for f in glob.glob(os.path.join(context.tmpDir, '*')):
       os.remove(f)
@@ -165,6 +167,12 @@ def step_impl(context, references, attachments, source):
   context.imported = source
   assert_that(context.zotero.import_file(context, source), equal_to(references))
 
+@step(r'I import a synthetic library of {references:d} references')
+def step_impl(context, references):
+  source = synthetic.library(references, context.zotero.client)
+  context.imported = source
+  assert_that(context.zotero.import_file(context, source), equal_to(references))
+
 def export_library(context, translator='BetterBibTeX JSON', collection=None, expected=None, output=None, displayOption=None, timeout=None, resetCache=False):
   expected = expand_scenario_variables(context, expected)
   displayOptions = { **context.displayOptions }
@@ -247,13 +255,15 @@ def step_impl(context, expected):
 def step_impl(context, mode, value):
   context.selected += context.zotero.execute('return await Zotero.BetterBibTeX.TestSupport.find({[mode]: value})', mode=mode, value=value)
   context.zotero.execute('await Zotero.BetterBibTeX.TestSupport.select(ids)', ids=context.selected)
-  time.sleep(3)
+  # an item can be picked by more than one step, but it is selected only once
+  assert context.zotero.wait_for('selected', 'key-manager-idle', ids=list(dict.fromkeys(context.selected))), 'selection did not settle'
 
 @when(u'I select {n} items with a field that {mode} "{value}"')
 def step_impl(context, n, mode, value):
   context.selected += context.zotero.execute('return await Zotero.BetterBibTeX.TestSupport.find({[mode]: value}, n)', mode=mode, value=value, n=int(n))
   context.zotero.execute('await Zotero.BetterBibTeX.TestSupport.select(ids)', ids=context.selected)
-  time.sleep(3)
+  # an item can be picked by more than one step, but it is selected only once
+  assert context.zotero.wait_for('selected', 'key-manager-idle', ids=list(dict.fromkeys(context.selected))), 'selection did not settle'
 
 @when(u'I remove all items from "{collection}"')
 def step_impl(context, collection):
@@ -335,17 +345,11 @@ def step_impl(context, seconds):
 
 @step(u'I wait at most {seconds:d} seconds until all auto-exports are done')
 def step_impl(context, seconds):
-  printed = False
-  timeout = True
-  for n in range(seconds):
-    if not context.zotero.execute('return Zotero.BetterBibTeX.TestSupport.autoExportRunning()'):
-      timeout = False
-      break
-    time.sleep(1)
-    utils.print('.', end='')
-    printed = True
-  if printed: utils.print('')
-  assert (not timeout), 'Auto-export timed out'
+  assert context.zotero.wait_for('auto-exports-done', timeout=seconds), 'Auto-export timed out'
+
+@step(u'I wait until the citation keys are settled')
+def step_impl(context):
+  assert context.zotero.wait_for('key-manager-idle'), 'citation keys did not settle'
 
 @step(u'I remove "{path}"')
 def step_impl(context, path):
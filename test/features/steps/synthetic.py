@@ -0,0 +1,182 @@
+import json
+import os
+import random
+import hashlib
+import glob
+import jsonpatch
+from steps.utils import ROOT
+
+# seeded generator for BBT JSON libraries of arbitrary size. Item types, fields and creator types come from the
+# client schemas, patched the same way setup/item.py patches them. Items are written to disk as they are generated;
+# only the collection membership is kept in memory
+
+SCHEMA = os.path.join(ROOT, 'schema')
+CACHE = os.path.join(ROOT, '.cache/synthetic')
+
+def schema(client):
+  with open(os.path.join(SCHEMA, f'{client}.json')) as f:
+    s = json.load(f)
+
+  # same restructuring as patch() in setup/item.py, which the patches are written against
+  s['itemTypes'] = {
+    itemType['itemType']: {
+      'itemType': itemType['itemType'],
+      'fields': { field['field']: field.get('baseField', field['field']) for field in itemType['fields'] },
+      'creatorTypes': [ct['creatorType'] for ct in itemType['creatorTypes'] ]
+    }
+    for itemType in s['itemTypes']
+  }
+  del s['locales']
+  for patch in ['schema.patch', f'{client}.patch']:
+    with open(os.path.join(SCHEMA, patch)) as f:
+      s = jsonpatch.apply_patch(s, json.load(f))
+  return s
+
+WORDS = {
+  'latin': 'analysis theory history data model method network study evidence review practice policy system culture language change structure process market health education energy design law city',
+  'german': 'Über Geschichte Gesellschaft Zeitschrift Forschung Bibliothek Grundlagen Wissenschaft Straße Bürger Öffentlichkeit',
+  'french': 'études société théâtre littérature économie région mémoire présentation français réalité',
+  'nordic': 'Fremtidens byrum drømme Københavns Ångström Ørsted bæredygtig',
+  'polish': 'Łódź źródła zażółć gęślą jaźń',
+  'greek': 'Ιστορία φιλοσοφία γλώσσα πολιτική',
+  'cyrillic': 'История литература общество Москва язык',
+  'cjk': '互联网 金融 监管 法律 研究 日本語 東京 歴史',
+}
+LASTNAMES = 'Smith Müller García Dubois Kowalski Jensen Øster Nguyễn Zhang 刘 Иванов Παπαδόπουλος Gehl Ó Súilleabháin van der Berg'.split(' ')
+FIRSTNAMES = 'Anna John Jürgen José Zoë Stig L. Bjarne Hua-chun Мария Élodie Søren Ahmed'.split(' ')
+ORGANISATIONS = ['World Health Organization', 'Bedre Byrum. Fonden Realdania', 'Европейская комиссия', '国立国会図書館']
+TAGS = ['Philosophy, Modern', 'methods', 'to read', 'Ökologie', 'économie', '研究', 'history', 'review', 'data', 'theory']
+
+# how likely a field is to be filled when the item type has it
+FILL = {
+  'title': 1.0, 'date': 0.95, 'url': 0.5, 'DOI': 0.4, 'language': 0.3, 'abstractNote': 0.4, 'extra': 0.15,
+  'publicationTitle': 0.9, 'volume': 0.7, 'issue': 0.6, 'pages': 0.8, 'publisher': 0.8, 'place': 0.6, 'ISBN': 0.4,
+  'ISSN': 0.3, 'shortTitle': 0.1, 'accessDate': 0.3, 'libraryCatalog': 0.3, 'callNumber': 0.1, 'rights': 0.05,
+}
+DEFAULT_FILL = 0.2
+
+class Generator:
+  def __init__(self, client='zotero', seed=0):
+    self.schema = schema(client)
+    self.random = random.Random(seed)
+    self.dates = { field for field, meta in self.schema['meta']['fields'].items() if meta['type'] == 'date' }
+    self.itemTypes = sorted(itemType for itemType in self.schema['itemTypes'] if itemType not in ['attachment', 'note', 'annotation'])
+    # a handful of common types dominate real libraries
+    self.weights = [{ 'journalArticle': 40, 'book': 15, 'bookSection': 10, 'conferencePaper': 8, 'thesis': 3, 'report': 3, 'webpage': 3 }.get(itemType, 1) for itemType in self.itemTypes]
+    self.words = { script: words.split(' ') for script, words in WORDS.items() }
+
+  def text(self, n):
+    # mostly plain ASCII, with the occasional stretch of another script
+    script = self.random.choices(list(self.words), weights=[70, 6, 6, 4, 2, 3, 4, 5])[0]
+    return ' '.join(self.random.choice(self.words[script]) for _ in range(n))
+
+  def date(self, field):
+    year, month, day = self.random.randint(1850, 2023), self.random.randint(1, 12), self.random.randint(1, 28)
+    if field == 'accessDate': return f'{year:04d}-{month:02d}-{day:02d}T12:00:00Z'
+    return self.random.choice([f'{year}', f'{year}-{month:02d}', f'{year}-{month:02d}-{day:02d}', f'{month}/{day}/{year}'])
+
+  def value(self, field, baseField):
+    if baseField in self.dates or field == 'accessDate': return self.date(field)
+    r = self.random
+    if field == 'url': return f'https://example.org/{r.randrange(10 ** 8)}'
+    if field == 'DOI': return f'10.{r.randint(1000, 9999)}/{r.randrange(10 ** 6)}'
+    if field == 'ISBN': return '978' + ''.join(str(r.randrange(10)) for _ in range(10))
+    if field == 'ISSN': return f'{r.randint(1000, 9999)}-{r.randint(1000, 9999)}'
+    if field == 'pages':
+      start = r.randint(1, 900)
+      return f'{start}-{start + r.randint(1, 40)}'
+    if baseField in ['volume', 'issue', 'number', 'edition', 'numPages', 'numberOfVolumes', 'section']: return str(r.randint(1, 300))
+    if field == 'language': return r.choice(['en', 'de', 'fr', 'da', 'ja', 'zh', 'ru', 'el', 'en-GB'])
+    if field == 'abstractNote': return self.text(r.randint(20, 80))
+    return self.text(r.randint(1, 8)).capitalize()
+
+  def creators(self, creatorTypes):
+    if not creatorTypes: return []
+    creators = []
+    for n in range(self.random.choices([0, 1, 2, 3, 4, 8, 30], weights=[5, 35, 25, 15, 10, 7, 3])[0]):
+      # the primary creator type comes first in the schema
+      creatorType = creatorTypes[0] if n == 0 or self.random.random() < 0.8 else self.random.choice(creatorTypes)
+      if self.random.random() < 0.05:
+        creators.append({ 'creatorType': creatorType, 'name': self.random.choice(ORGANISATIONS) })
+      else:
+        creators.append({ 'creatorType': creatorType, 'firstName': self.random.choice(FIRSTNAMES), 'lastName': self.random.choice(LASTNAMES) })
+    return creators
+
+  def tags(self):
+    return [{ 'tag': tag } for tag in self.random.sample(TAGS, self.random.choices([0, 1, 2, 5], weights=[50, 25, 15, 10])[0])]
+
+  def note(self):
+    return f'<p>{self.text(self.random.randint(5, 40))}</p>'
+
+  def item(self, itemID):
+    r = self.random
+    itemType = r.choices(self.itemTypes, weights=self.weights)[0]
+    schema = self.schema['itemTypes'][itemType]
+    item = { 'itemType': itemType, 'itemID': itemID }
+
+    for field, baseField in schema['fields'].items():
+      if r.random() >= FILL.get(field, DEFAULT_FILL): continue
+      if field == 'extra':
+        item['extra'] = r.sample([f'tex.note: {self.text(3)}', f'original-date: {r.randint(1700, 1900)}', 'Citation Key: ' + self.text(1).replace(' ', '')], r.randint(1, 2))
+      else:
+        item[baseField] = self.value(field, baseField)
+
+    if creators := self.creators(schema['creatorTypes']): item['creators'] = creators
+    if tags := self.tags(): item['tags'] = tags
+    if r.random() < 0.15: item['notes'] = [self.note() for _ in range(r.randint(1, 3))]
+    if r.random() < 0.2:
+      item['attachments'] = [
+        # linked URLs, so importing does not need files on disk
+        { 'itemType': 'attachment', 'linkMode': 'linked_url', 'title': self.text(2), 'url': f'https://example.org/{r.randrange(10 ** 8)}', 'contentType': 'text/html' }
+        for _ in range(r.randint(1, 2))
+      ]
+    return item
+
+  def collections(self, n):
+    collections = {}
+    for i in range(n):
+      key = f'coll:{i:05d}'
+      collections[key] = { 'key': key, 'name': self.text(self.random.randint(1, 3)).capitalize(), 'collections': [], 'items': [] }
+      # about a third of the collections nest under an earlier one
+      if i > 0 and self.random.random() < 0.35:
+        parent = f'coll:{self.random.randrange(i):05d}'
+        collections[key]['parent'] = parent
+        collections[parent]['collections'].append(key)
+    return collections
+
+  def write(self, path, size):
+    # returns the number of top-level items, which is what TestSupport.importFile reports
+    collections = self.collections(max(1, size // 200))
+    keys = list(collections)
+
+    with open(path, 'w') as f:
+      f.write('{"config": ' + json.dumps({ 'id': '36a3b0b5-bad0-4a04-b79b-441c7cef77db', 'label': 'BetterBibTeX JSON', 'options': {}, 'preferences': {} }))
+      f.write(', "items": [')
+      for itemID in range(1, size + 1):
+        if self.random.random() < 0.02:
+          item = { 'itemType': 'note', 'itemID': itemID, 'note': self.note() }
+        else:
+          item = self.item(itemID)
+        for _ in range(self.random.choices([0, 1, 2], weights=[40, 50, 10])[0]):
+          collections[self.random.choice(keys)]['items'].append(itemID)
+        if itemID > 1: f.write(',')
+        f.write('\n')
+        json.dump(item, f, ensure_ascii=False)
+      f.write('\n], "collections": ')
+      json.dump(collections, f, ensure_ascii=False)
+      f.write('}\n')
+    return size
+
+def library(size, client='zotero', seed=0):
+  # generated libraries are deterministic, so they're kept around until the schemas or the generator change
+  digest = hashlib.sha256()
+  for path in sorted(glob.glob(os.path.join(SCHEMA, '*.json')) + glob.glob(os.path.join(SCHEMA, '*.patch'))) + [__file__]:
+    with open(path, 'rb') as f:
+      digest.update(f.read())
+  path = os.path.join(CACHE, f'{client}-{size}-{seed}-{digest.hexdigest()[:12]}.json')
+
+  if not os.path.exists(path):
+    os.makedirs(CACHE, exist_ok=True)
+    Generator(client, seed).write(path + '.tmp', size)
+    os.replace(path + '.tmp', path)
+  return path
@@ -0,0 +1,261 @@
+import sqlite3
+import uuid
+import json
+import time
+import os
+import re
+import threading
+import psutil
+from pygit2 import Repository
+import steps.utils as utils
+
+# structured timings for bridge calls and steps, kept in a local SQLite database; see util/timings.py for the report
+
+SCHEMA = '''
+  CREATE TABLE IF NOT EXISTS runs (
+    run INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    commit_id TEXT NOT NULL,
+    client TEXT NOT NULL,
+    worker INTEGER NOT NULL,
+    started REAL NOT NULL
+  );
+  CREATE TABLE IF NOT EXISTS executes (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    scenario TEXT,
+    step TEXT,
+    label TEXT NOT NULL,
+    sent INTEGER NOT NULL,
+    received INTEGER NOT NULL,
+    server_msecs REAL,
+    roundtrip_msecs REAL NOT NULL,
+    translator TEXT,
+    items INTEGER
+  );
+  CREATE TABLE IF NOT EXISTS steps (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    scenario TEXT NOT NULL,
+    step_type TEXT NOT NULL,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    msecs REAL NOT NULL
+  );
+  CREATE TABLE IF NOT EXISTS memory_samples (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    scenario TEXT NOT NULL,
+    secs REAL NOT NULL,
+    rss REAL,
+    resident REAL,
+    delta REAL
+  );
+  CREATE TABLE IF NOT EXISTS memory_scenarios (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    scenario TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    start_rss REAL,
+    end_rss REAL,
+    peak_rss REAL,
+    start_resident REAL,
+    end_resident REAL,
+    peak_resident REAL
+  );
+  CREATE TABLE IF NOT EXISTS cache (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    scenario TEXT,
+    step TEXT,
+    source TEXT NOT NULL,
+    translator TEXT NOT NULL,
+    options TEXT,
+    entries_before INTEGER NOT NULL,
+    entries_after INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    misses INTEGER NOT NULL,
+    invalidated TEXT NOT NULL
+  );
+  CREATE INDEX IF NOT EXISTS runs_branch ON runs(branch, session);
+  CREATE INDEX IF NOT EXISTS steps_run ON steps(run, step_type);
+  CREATE INDEX IF NOT EXISTS executes_run ON executes(run, label);
+'''
+
+def step_type(name):
+  # collapse the arguments so steps that share a definition are reported together
+  name = re.sub(r'"[^"]*"', '"..."', name)
+  return re.sub(r'\b[0-9]+(\.[0-9]+)?\b', 'N', name)
+
+def label(script):
+  calls = []
+  for call in re.findall(r'\b(Zotero(?:\.\w+)+)\s*\(', script):
+    if call not in calls: calls.append(call)
+  if calls: return ', '.join(calls[:3])
+  return script.strip().split('\n')[-1][:60]
+
+class Timings:
+  def __init__(self, path, client, worker):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # parallel workers share the database: autocommit, so no write transaction stays open between rows, and WAL, so
+    # the report can read while workers write
+    self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.executescript(SCHEMA)
+
+    repo = Repository('.')
+    # parallel workers share the session set by the coordinator
+    session = os.environ.get('BBT_TIMINGS_SESSION') or str(uuid.uuid4())
+    self.run = self.db.execute('INSERT INTO runs (session, branch, commit_id, client, worker, started) VALUES (?, ?, ?, ?, ?, ?)', (
+      session, repo.head.shorthand, str(repo.head.target), client, worker, time.time()
+    )).lastrowid
+    self.db.commit()
+
+    self.scenario = None
+    self.step = None
+    self.last = None
+    self.cache = (None, {})
+
+  def wrap(self, script):
+    # have the bridge report how long the script itself took, next to the round-trip measured here
+    return f'''
+      const started = Date.now();
+      const result = await (async () => {{
+        {script}
+      }})();
+      return {{ result: typeof result === 'undefined' ? null : result, msecs: Date.now() - started }};
+    '''
+
+  def record(self, script, sent, body, roundtrip):
+    response = json.loads(body)
+    self.last = self.db.execute('''
+      INSERT INTO executes (run, scenario, step, label, sent, received, server_msecs, roundtrip_msecs)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (self.run, self.scenario, self.step, label(script), sent, len(body), response['msecs'], roundtrip * 1000)).lastrowid
+    return response['result']
+
+  def annotate(self, translator=None, items=None):
+    if self.last is None: return
+    self.db.execute('UPDATE executes SET translator = ?, items = ? WHERE ROWID = ?', (translator, items, self.last))
+
+  def record_cache(self, state, source, options=None):
+    # state is TestSupport.cacheState: per cache collection, the entries and the hits, misses and invalidations by
+    # reason counted since the scenario started. Rows hold the change since the previous snapshot in the scenario;
+    # source is 'export' for an export_library call, 'background' for what happened in between, such as auto-exports
+    # and invalidations by edits or preference changes
+    scenario, previous = self.cache
+    if scenario != self.scenario: previous = {}
+    self.cache = (self.scenario, state)
+
+    for translator, now in state.items():
+      then = previous.get(translator, { 'entries': now['entries'], 'hits': 0, 'misses': 0, 'invalidated': {} })
+      hits, misses = now['hits'] - then['hits'], now['misses'] - then['misses']
+      invalidated = { reason: n - then['invalidated'].get(reason, 0) for reason, n in now['invalidated'].items() if n != then['invalidated'].get(reason, 0) }
+      if source == 'background' and not (hits or misses or invalidated): continue
+      if source == 'export' and not (hits or misses): continue
+      self.db.execute('''
+        INSERT INTO cache (run, scenario, step, source, translator, options, entries_before, entries_after, hits, misses, invalidated)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+      ''', (
+        self.run, self.scenario, self.step, source, translator, json.dumps(options, sort_keys=True) if options is not None else None,
+        then['entries'], now['entries'], hits, misses, json.dumps(invalidated, sort_keys=True)
+      ))
+
+  def record_step(self, step):
+    self.db.execute('INSERT INTO steps (run, scenario, step_type, step, status, msecs) VALUES (?, ?, ?, ?, ?, ?)', (
+      self.run, self.scenario, step_type(step.name), step.name, step.status.name, step.duration * 1000
+    ))
+
+  def record_memory(self, scenario, seq, samples):
+    self.db.executemany('INSERT INTO memory_samples (run, scenario, secs, rss, resident, delta) VALUES (?, ?, ?, ?, ?, ?)', [
+      (self.run, scenario, sample.secs, sample.rss, sample.resident, sample.delta)
+      for sample in samples
+    ])
+
+    def peak(field):
+      values = [getattr(sample, field) for sample in samples if getattr(sample, field) is not None]
+      return (values[0], values[-1], max(values)) if values else (None, None, None)
+    self.db.execute('''
+      INSERT INTO memory_scenarios (run, scenario, seq, start_rss, end_rss, peak_rss, start_resident, end_resident, peak_resident)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (self.run, scenario, seq, *peak('rss'), *peak('resident')))
+
+  def commit(self):
+    self.db.commit()
+
+MB = 1024 * 1024
+
+class Sample:
+  def __init__(self, secs, rss, resident, delta):
+    self.secs = secs
+    self.rss = rss
+    self.resident = resident
+    self.delta = delta
+
+def trend(values):
+  # least-squares slope
+  n = len(values)
+  mean_x = (n - 1) / 2
+  mean_y = sum(values) / n
+  return sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / sum((x - mean_x) ** 2 for x in range(n))
+
+class MemoryTimeline:
+  # samples Zotero memory during a scenario: RSS of the Zotero process tree via psutil, and resident/delta as Zotero
+  # reports it through TestSupport.memoryState. Samples are buffered and written from the main thread, since the
+  # SQLite connection cannot be shared with the sampler thread
+  def __init__(self, zotero, every, window=10, leak=5):
+    self.zotero = zotero
+    self.every = every
+    self.window = window # scenarios considered for leak detection
+    self.leak = leak # MB per scenario baseline growth that counts as a leak
+    self.baselines = []
+    self.seq = 0
+    self.thread = None
+
+  def rss(self):
+    if self.zotero.proc is None: return None
+    try:
+      zotero = psutil.Process(self.zotero.proc.pid)
+      return sum(p.memory_info().rss for p in [zotero] + zotero.children(recursive=True)) / MB
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+      return None
+
+  def sample(self):
+    try:
+      # over a bridge of its own, bypassing the timings, which belong to the main thread; the connection pool of the
+      # main bridge isn't shared across threads
+      state = json.loads(self.bridge.post(self.zotero.script('return Zotero.BetterBibTeX.TestSupport.memoryState("behave timeline")'), timeout=self.every * 2 + 5))
+      resident, delta = state['resident'], state['delta']
+    except Exception:
+      resident = delta = None
+    self.samples.append(Sample(time.time() - self.started, self.rss(), resident, delta))
+
+  def run(self):
+    while not self.stop.wait(self.every):
+      self.sample()
+
+  def start(self):
+    from steps.zotero import Bridge # steps.zotero imports this module
+    self.bridge = Bridge(self.zotero.port, self.zotero.password, size=1)
+    self.samples = []
+    self.started = time.time()
+    self.sample()
+    self.stop = threading.Event()
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def finish(self, scenario):
+    if self.thread is None: return
+    self.stop.set()
+    self.thread.join()
+    self.thread = None
+    self.sample()
+    self.bridge.close()
+
+    self.seq += 1
+    if self.zotero.timings: self.zotero.timings.record_memory(scenario, self.seq, self.samples)
+
+    rss = [sample.rss for sample in self.samples if sample.rss is not None]
+    if rss:
+      utils.print(f'memory: {rss[0]:.0f}MB at start, peak {max(rss):.0f}MB, {rss[-1]:.0f}MB at end')
+
+      # every scenario starts right after a reset, so a rising start-of-scenario baseline points at a leak
+      self.baselines = (self.baselines + [rss[0]])[-self.window:]
+      if len(self.baselines) == self.window and (slope := trend(self.baselines)) > self.leak:
+        utils.print(f'memory: baseline grew {slope:.1f}MB per scenario over the last {self.window} scenarios')
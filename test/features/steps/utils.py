@@ -13,6 +13,7 @@ import psutil
 import shlex
 from collections import UserDict
 import copy
+import functools
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module='bs4', message='.*looks like a URL.*')
@@ -28,9 +29,28 @@ def print(txt, end='\n'):
   sys.stdout.flush()
 
 class HashableDict(dict):
+  # the digest is computed once and dropped on mutation; nested values are assumed not to change after hashing
+  __digest = None
+
   def __hash__(self):
     # lower case before hash?
-    return str(hash(json.dumps(self, sort_keys=True)))
+    if self.__digest is None: self.__digest = str(hash(json.dumps(self, sort_keys=True)))
+    return self.__digest
+
+  def __mutator(name):
+    def mutate(self, *args, **kwargs):
+      self.__digest = None
+      return getattr(dict, name)(self, *args, **kwargs)
+    return mutate
+
+  __setitem__ = __mutator('__setitem__')
+  __delitem__ = __mutator('__delitem__')
+  pop = __mutator('pop')
+  popitem = __mutator('popitem')
+  setdefault = __mutator('setdefault')
+  update = __mutator('update')
+  clear = __mutator('clear')
+  del __mutator
 
 class benchmark(object):
   def __init__(self,name):
@@ -51,6 +71,91 @@ class benchmark(object):
 def assert_equal_diff(expected, found):
   assert expected == found, '\n' + '\n'.join(difflib.unified_diff(expected.split('\n'), found.split('\n'), fromfile='expected', tofile='found', lineterm=''))
 
+def assert_equal_library(expected, found, limit=10, text=False):
+  # structural comparison of normalized libraries: items are matched by content first; the leftovers are paired with
+  # the found item of the same type that has the most fields in common, and only the first `limit` mismatches are
+  # reported, field by field. `text` adds a unified diff per mismatch
+  if expected == found: return
+
+  MISSING = object()
+
+  def show(value):
+    if value is MISSING: return 'nothing'
+    value = json.dumps(value, ensure_ascii=True, sort_keys=True)
+    return value if len(value) <= 200 else value[:200] + '...'
+
+  def unified(expected, found):
+    return list(difflib.unified_diff(serialize(expected).split('\n'), serialize(found).split('\n'), fromfile='expected', tofile='found', lineterm=''))
+
+  def differences(path, expected, found):
+    # down to the values that differ, so a changed collection or creator is reported as just that
+    if isinstance(expected, dict) and isinstance(found, dict):
+      for key in sorted(set(expected.keys()) | set(found.keys()), key=str):
+        if expected.get(key, MISSING) != found.get(key, MISSING):
+          yield from differences(f'{path}.{key}' if path else str(key), expected.get(key, MISSING), found.get(key, MISSING))
+    elif isinstance(expected, list) and isinstance(found, list) and len(expected) == len(found):
+      for i, (e, f) in enumerate(zip(expected, found)):
+        if e != f: yield from differences(f'{path}[{i}]', e, f)
+    else:
+      yield f'  {path}: expected {show(expected)}, found {show(found)}'
+
+  report = []
+  for key in sorted(set(expected.keys()) | set(found.keys())):
+    if key != 'items' and expected.get(key, MISSING) != found.get(key, MISSING):
+      report.append(f'{key} differs:')
+      report += differences(key, expected.get(key, MISSING), found.get(key, MISSING))
+      if text: report += unified(expected.get(key), found.get(key))
+
+  expected_items = expected.get('items', [])
+  found_items = found.get('items', [])
+
+  unmatched = {}
+  for item in found_items:
+    unmatched.setdefault(serialize(item), []).append(item)
+  missing = []
+  for item in expected_items:
+    if same := unmatched.get(serialize(item)):
+      same.pop()
+    else:
+      missing.append(item)
+
+  extra = {}
+  for items in unmatched.values():
+    for item in items:
+      extra.setdefault(item.get('itemType'), []).append(item)
+
+  def overlap(item, other):
+    return sum(1 for field, value in item.items() if field != 'itemType' and other.get(field, MISSING) == value)
+
+  differing = 0
+  for item in missing:
+    if differing == limit:
+      report.append(f'stopped after {limit} differing items')
+      break
+    differing += 1
+
+    candidates = extra.get(item.get('itemType'), [])
+    best = max(range(len(candidates)), key=lambda i: overlap(item, candidates[i]), default=None)
+    if best is not None and overlap(item, candidates[best]) > 0:
+      other = candidates.pop(best)
+      report.append(f'item {show(item.get("title"))} ({item.get("itemType")}) differs:')
+      report += differences('', item, other)
+      if text: report += unified(item, other)
+    else:
+      report.append(f'item {show(item.get("title"))} ({item.get("itemType")}) missing')
+      if text: report += unified(item, None)
+
+  if differing < limit:
+    for items in extra.values():
+      for item in items:
+        if differing == limit: break
+        differing += 1
+        report.append(f'item {show(item.get("title"))} ({item.get("itemType")}) unexpected')
+        if text: report += unified(None, item)
+
+  report.insert(0, f'expected {len(expected_items)} items, found {len(found_items)}')
+  raise AssertionError('\n' + '\n'.join(report))
+
 def expand_scenario_variables(context, filename, star=True):
   scenario = None
   if hasattr(context, 'scenario') and context.scenario.keyword == 'Scenario': # exclude outlines
@@ -65,7 +170,10 @@ def expand_scenario_variables(context, filename, star=True):
 def clean_html(html):
   return BeautifulSoup(html, 'html.parser').prettify()
 
+@functools.lru_cache(maxsize=4096)
 def html2md(html):
+  # tags and notes repeat a lot across a library, and plain text never needs the soup; bounded, as whole note bodies
+  # would otherwise stay around for the entire run
   if '<' in html: html = md(BeautifulSoup(html, 'lxml').prettify())
   return html.strip()
 
@@ -74,13 +182,13 @@ def serialize(obj):
 
 def extra_lower(obj):
   if isinstance(obj, dict) and 'items' in obj:
-    obj = copy.deepcopy(obj)
-    for item in obj['items']:
-      if 'extra' in item:
-        if type(item['extra']) == list:
-          item['extra'] = [line.lower() for line in item['extra']]
-        else:
-          item['extra'] = item['extra'].lower()
+    # only the items that carry an extra field need copying; the others keep their cached digest
+    obj = copy.copy(obj)
+    obj['items'] = [
+      HashableDict({ **item, 'extra': [line.lower() for line in item['extra']] if type(item['extra']) == list else item['extra'].lower() })
+      if 'extra' in item else item
+      for item in obj['items']
+    ]
   return obj
 
 def running(id):
@@ -1,20 +1,27 @@
 import bs4
 import sqlite3
 import uuid
+import hashlib
+import pickle
 import json, jsonpatch
+import ijson
 import os
-import redo
 import platform
 import configparser
 import glob
 from selenium import webdriver
 import toml
 import urllib
+import urllib.error
+import http.client
+import queue
 import tempfile
 from munch import *
-from steps.utils import running, nested_dict_iter, benchmark, ROOT, assert_equal_diff, serialize, html2md, clean_html, extra_lower
+from steps.utils import running, nested_dict_iter, benchmark, ROOT, assert_equal_diff, assert_equal_library, serialize, html2md, clean_html, extra_lower
 from steps.library import load as Library
-from steps.bbtjsonschema import validate as validate_bbt_json
+from steps.timings import Timings
+from steps.bbtjsonschema import validate as validate_bbt_json, validate_item as validate_bbt_json_item
+import steps.bbtjsonschema as bbtjsonschema
 import steps.utils as utils
 import shutil
 import shlex
@@ -28,6 +35,8 @@ from collections import OrderedDict, MutableMapping
 import sys
 import threading
 import socket
+import select
+import fcntl
 from pathlib import PurePath
 from diff_match_patch import diff_match_patch
 from pygit2 import Repository
@@ -39,6 +48,13 @@ yaml.default_flow_style = False
 
 EXPORTED = os.path.join(ROOT, 'exported')
 FIXTURES = os.path.join(ROOT, 'test/fixtures')
+PROFILES = os.path.join(ROOT, '.cache/profiles')
+# profile templates kept, most recently used first; every pref or fixture change makes a new one
+PROFILE_TEMPLATES = 10
+FIXTURE_CACHE = os.path.join(ROOT, '.cache/fixtures')
+# libraries larger than this are imported without loading them into memory
+STREAM_IMPORT = 10 * 1024 * 1024
+CACHE_STATE = 'return Zotero.BetterBibTeX.TestSupport.cacheState()'
 
 def install_proxies(xpis, profile):
   for xpi in xpis:
@@ -75,22 +91,205 @@ def install_xpis(path, profile):
     utils.print(f'installing {xpi}')
     profile.add_extension(xpi)
 
+def fingerprint(*patterns):
+  # cheap change detection for profile template inputs: path, size and mtime of every file matched
+  stats = []
+  for pattern in patterns:
+    for path in sorted(glob.glob(pattern)):
+      if os.path.isdir(path):
+        files = sorted(f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True) if os.path.isfile(f))
+      else:
+        files = [path]
+      for f in files:
+        st = os.stat(f)
+        stats.append([os.path.relpath(f, ROOT), st.st_size, st.st_mtime_ns])
+  return stats
+
+def link_or_copy(src, dst):
+  # xpis are never written to by Zotero, so they can be shared with the template; everything else gets a private copy
+  if src.endswith('.xpi'):
+    try:
+      os.link(src, dst)
+      return dst
+    except OSError:
+      pass
+  return shutil.copy2(src, dst)
+
+class Fixtures:
+  # parsed, patched and validated fixtures, keyed on the source files and (for validated fixtures) the schema. Entries
+  # are kept pickled so every load hands out a private copy the caller is free to modify
+  def __init__(self, path):
+    self.path = path
+    self.memory = {}
+
+  def id(self, sources, validate):
+    return hashlib.sha256(json.dumps([sources, validate and bbtjsonschema.digest]).encode('utf-8')).hexdigest()
+
+  def stats(self, sources):
+    return [[os.stat(source).st_size, os.stat(source).st_mtime_ns] for source in sources]
+
+  def hashes(self, sources):
+    hashes = []
+    for source in sources:
+      with open(source, 'rb') as f:
+        hashes.append(hashlib.sha256(f.read()).hexdigest())
+    return hashes
+
+  def get(self, sources, validate):
+    id = self.id(sources, validate)
+    if not (entry := self.memory.get(id)):
+      try:
+        with open(os.path.join(self.path, id + '.pickle'), 'rb') as f:
+          entry = self.memory[id] = pickle.load(f)
+      except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+
+    stats = self.stats(sources)
+    if entry['stats'] != stats:
+      # touched but possibly not changed
+      if entry['hashes'] != self.hashes(sources): return None
+      entry['stats'] = stats
+      self.save(id, entry)
+
+    return pickle.loads(entry['data'])
+
+  def put(self, sources, validate, data):
+    id = self.id(sources, validate)
+    entry = self.memory[id] = {
+      'stats': self.stats(sources),
+      'hashes': self.hashes(sources),
+      'data': pickle.dumps(data, pickle.HIGHEST_PROTOCOL),
+    }
+    self.save(id, entry)
+    return pickle.loads(entry['data'])
+
+  def save(self, id, entry):
+    os.makedirs(self.path, exist_ok=True)
+    # write-and-rename so parallel workers never see a partial entry
+    tmp = os.path.join(self.path, f'{id}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+      pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, os.path.join(self.path, id + '.pickle'))
+
+class LogWatch:
+  # follows the Zotero log from where this start left it, so markers from earlier runs in the same log don't count
+  def __init__(self, path, append):
+    self.path = path
+    self.offset = os.path.getsize(path) if append and os.path.exists(path) else 0
+
+  def wait(self, marker, timeout, every=0.05, until=None):
+    # until: an alternative condition that ends the wait early, for when the marker may never show
+    marker = marker.encode('utf-8')
+    deadline = time.time() + timeout
+    tail = b''
+    while time.time() < deadline:
+      if until and until(): return False
+      try:
+        with open(self.path, 'rb') as f:
+          f.seek(self.offset)
+          chunk = f.read()
+      except FileNotFoundError:
+        chunk = b''
+      if chunk:
+        self.offset += len(chunk)
+        # keep enough of what was read so far to catch a marker split across reads, including reads shorter than it
+        tail += chunk
+        if marker in tail: return True
+        tail = tail[-len(marker):]
+      time.sleep(every)
+    return False
+
 class Pinger():
   def __init__(self, every):
     self.every = every
+    self.busy = None
+    self.thread = None
 
   def __enter__(self):
-    self.stop = threading.Event()
-    threading.Timer(self.every, self.display, [time.time(), self.every, self.stop]).start()
+    self.busy = time.time()
+    # one long-lived ticker rather than a timer thread per request
+    if self.thread is None:
+      self.thread = threading.Thread(target=self.display, daemon=True)
+      self.thread.start()
 
   def __exit__(self, *args):
-    self.stop.set()
+    self.busy = None
+
+  def display(self):
+    while True:
+      time.sleep(self.every)
+      busy = self.busy
+      if busy is not None and time.time() - busy >= self.every:
+        utils.print('.', end='')
+
+class Bridge:
+  def __init__(self, port, password, size=2):
+    self.port = port
+    self.password = password
+    self.size = size
+    self.idle = queue.LifoQueue()
+    self.url = f'http://127.0.0.1:{self.port}/debug-bridge/execute'
+
+  def acquire(self, timeout):
+    while True:
+      try:
+        conn = self.idle.get_nowait()
+      except queue.Empty:
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+        reused = False
+        break
+      # an idle socket the server has closed reads as ready (EOF); drop it rather than send a script into it
+      if conn.sock is None or select.select([conn.sock], [], [], 0)[0]:
+        conn.close()
+        continue
+      reused = True
+      break
+    conn.timeout = timeout
+    if conn.sock: conn.sock.settimeout(timeout)
+    return conn, reused
+
+  def release(self, conn):
+    if self.idle.qsize() < self.size:
+      self.idle.put(conn)
+    else:
+      conn.close()
 
-  def display(self, start, every, stop):
-    if stop.is_set(): return
+  def close(self):
+    while True:
+      try:
+        self.idle.get_nowait().close()
+      except queue.Empty:
+        break
+
+  def post(self, script, timeout):
+    while True:
+      conn, reused = self.acquire(timeout)
+      sent = False
+      try:
+        conn.request('POST', f'/debug-bridge/execute?password={self.password}', body=script.encode('utf-8'), headers={'Content-type': 'application/javascript', 'Connection': 'keep-alive'})
+        sent = True
+        res = conn.getresponse()
+        body = res.read().decode()
+      except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+        conn.close()
+        # the server dropped an idle keep-alive connection before the script went out; retry on a fresh one. Once the
+        # script is sent it may have run, and scripts aren't safe to run twice
+        if reused and not sent: continue
+        raise urllib.error.URLError(e)
+      except ConnectionRefusedError as e:
+        conn.close()
+        raise urllib.error.URLError(e)
+      except:
+        conn.close()
+        raise
+
+      if res.will_close:
+        conn.close()
+      else:
+        self.release(conn)
 
-    utils.print('.', end='')
-    threading.Timer(every, self.display, [start, every, stop]).start()
+      if res.status >= 400: raise urllib.error.HTTPError(self.url, res.status, body, res.headers, None)
+      return body
 
 class Config:
   def __init__(self, userdata):
@@ -146,11 +345,18 @@ class Config:
   def __str__(self):
     return str(self.data)
 
+  def fingerprint(self):
+    # the settings that determine what a started instance looks like; timeouts don't
+    return json.dumps({ k: getattr(self, k) for k in ['db', 'profile', 'locale', 'first_run'] }, sort_keys=True)
+
 class Zotero:
   def __init__(self, userdata):
-    assert not running('Zotero'), 'Zotero is running'
+    # worker 0 is the classic single-instance setup; parallel workers get their own port, profile, and export/temp dirs
+    self.worker = int(userdata.get('worker', '0'))
+    if not self.worker: assert not running('Zotero'), 'Zotero is running'
 
     self.fixtures_loaded = set()
+    self.fixtures = Fixtures(FIXTURE_CACHE)
     self.fixtures_loaded_log = userdata.get('loaded')
 
     self.client = userdata.get('client', 'zotero')
@@ -162,9 +368,13 @@ class Zotero:
 
     self.proc = None
 
-    if os.path.exists(EXPORTED):
-      shutil.rmtree(EXPORTED)
-    os.makedirs(EXPORTED)
+    self.exported_dir = EXPORTED + (f'-{self.worker}' if self.worker else '')
+    if os.path.exists(self.exported_dir):
+      shutil.rmtree(self.exported_dir)
+    os.makedirs(self.exported_dir)
+    self.tmpdir = tempfile.mkdtemp(prefix=f'bbt-worker-{self.worker}-') if self.worker else None
+    # registered before shutdown, and atexit runs last-in first-out, so this goes after Zotero has quit
+    if self.tmpdir: atexit.register(shutil.rmtree, self.tmpdir, ignore_errors=True)
 
     if self.client == 'zotero':
       self.port = 23119
@@ -172,6 +382,12 @@ class Zotero:
       self.port = 24119
     else:
       raise ValueError(f'Unexpected client "{self.client}"')
+    self.port += self.worker
+    if self.worker:
+      with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        assert sock.connect_ex(('127.0.0.1', self.port)) != 0, f'port {self.port} for worker {self.worker} is in use'
+    self.bridge = Bridge(self.port, self.password)
+    self.pinger = Pinger(20)
 
     self.zotero = self.client == 'zotero'
     self.jurism = self.client == 'jurism'
@@ -188,20 +404,62 @@ class Zotero:
     else:
       self.workers = 0
     self.caching = userdata.get('caching', 'true') == 'true'
+    # -D diff=text adds unified diffs of the mismatched items to library comparison failures
+    self.text_diff = userdata.get('diff') == 'text'
+
+    # -D timings=false disables the timings database, -D timings=<path> puts it elsewhere
+    timings = userdata.get('timings', os.path.join(ROOT, '.cache/timings.sqlite'))
+    self.timings = Timings(timings, self.client, self.worker) if timings != 'false' else None
 
     self.preferences = Preferences(self)
+    # a restart that reset() put off until Zotero is actually needed, and the scenario it was for
+    self.pending_start = False
+    self.scenario = None
     self.redir = '>'
     self.start()
     self.redir = '>>'
 
-  def execute(self, script, **args):
+  def script(self, script, **args):
     for var, value in args.items():
       script = f'const {var} = {json.dumps(value)};\n' + script
+    return script
 
-    with Pinger(20):
-      req = urllib.request.Request(f'http://127.0.0.1:{self.port}/debug-bridge/execute?password={self.password}', data=script.encode('utf-8'), headers={'Content-type': 'application/javascript'})
-      res = urllib.request.urlopen(req, timeout=self.config.timeout * self.config.trace_factor).read().decode()
-      return json.loads(res)
+  def execute(self, script, **args):
+    self.resume()
+    # anything sent after startup or reset may have changed the library or preferences
+    self.dirty = True
+    script = self.script(script, **args)
+    timeout = self.config.timeout * self.config.trace_factor
+    with self.pinger:
+      if not self.timings:
+        return json.loads(self.bridge.post(script, timeout=timeout))
+
+      wrapped = self.timings.wrap(script)
+      started = time.time()
+      body = self.bridge.post(wrapped, timeout=timeout)
+      return self.timings.record(script, len(wrapped.encode('utf-8')), body, time.time() - started)
+
+  def execute_many(self, scripts):
+    # scripts are either plain strings or (script, args) tuples; each runs in its own scope, in order, in a single round-trip
+    batch = 'const results = [];\n'
+    for script in scripts:
+      if type(script) == str:
+        script = self.script(script)
+      else:
+        script = self.script(script[0], **script[1])
+      batch += f'results.push(await (async () => {{\n{script}\n}})());\n'
+    batch += 'return results.map(result => typeof result === "undefined" ? null : result);'
+    return self.execute(batch)
+
+  def wait_for(self, *conditions, timeout=None, **args):
+    # TestSupport.waitFor answers the moment the conditions hold; waits longer than the bridge timeout are split over
+    # several calls
+    deadline = time.time() + (timeout or self.config.timeout)
+    while True:
+      wait = max(min(deadline - time.time(), self.config.timeout - 1), 0)
+      if self.execute('return await Zotero.BetterBibTeX.TestSupport.waitFor(conditions, wait, args)', conditions=list(conditions), wait=int(wait * 1000), args=args):
+        return True
+      if time.time() >= deadline: return False
 
   def shutdown(self):
     if self.proc is None: return
@@ -214,6 +472,7 @@ class Zotero:
       """)
     except:
       pass
+    self.bridge.close()
 
     def on_terminate(proc):
         utils.print("process {} terminated with exit code {}".format(proc, proc.returncode))
@@ -241,15 +500,34 @@ class Zotero:
         for p in alive:
           utils.print("process {} survived SIGKILL; giving up" % p)
     self.proc = None
-    assert not running('Zotero')
+    if not self.worker: assert not running('Zotero')
 
   def restart(self, **kwargs):
-    self.shutdown()
     self.config.update(**kwargs)
+
+    # an instance nothing was sent to since it started is as good as a new one with the same config
+    if self.proc is not None and not self.pending_start and not self.dirty and self.config.fingerprint() == self.instance:
+      utils.print(f'{self.client} is already running with {self.config.fingerprint()}, keeping it')
+      return
+
+    # after a put-off reset, the previous instance is already gone and this starts straight into the requested config
+    self.shutdown()
+    self.start()
+    if self.scenario:
+      self.execute('Zotero.BetterBibTeX.TestSupport.scenario = scenario', scenario=self.scenario)
+      self.dirty = False
+
+  def resume(self):
+    # the start reset() put off; this resets the preference shadow, so callers that compute against it resume first
+    if not self.pending_start: return
+    self.pending_start = False
     self.start()
+    self.reset(self.scenario)
 
   def start(self):
+    self.pending_start = False
     self.needs_restart = False
+    self.preferences.forget()
     profile = self.create_profile()
     shutil.rmtree(os.path.join(profile.path, self.client, 'better-bibtex'), ignore_errors=True)
 
@@ -260,29 +538,39 @@ class Zotero:
       datadir_profile = ''
     cmd = f'{shlex.quote(profile.binary)} -P {shlex.quote(profile.name)} -jsconsole -purgecaches -ZoteroDebugText {datadir_profile} {self.redir} {shlex.quote(profile.path + ".log")} 2>&1'
     utils.print(f'Starting {self.client}: {cmd}')
-    self.proc = subprocess.Popen(cmd, shell=True)
+    log = LogWatch(profile.path + '.log', append=(self.redir == '>>'))
+    env = None
+    if self.tmpdir: env = { **os.environ, 'TMPDIR': self.tmpdir }
+    self.proc = subprocess.Popen(cmd, shell=True, env=env)
     utils.print(f'{self.client} started: {self.proc.pid}')
 
     ready = False
     self.config.stash()
-    self.config.timeout = 2
     with benchmark(f'starting {self.client}') as bm:
-      posted = False
-      for _ in redo.retrier(attempts=120,sleeptime=1):
+      deadline = time.time() + 120
+
+      # don't knock on the bridge before it's there; once the HTTP server takes connections, polling the bridge takes
+      # over, so a marker that never shows (other debug-bridge version, redirected logs) doesn't hold up the start
+      if log.wait('debug-bridge: endpoint installed', timeout=30, until=self.listening):
+        utils.print('debug bridge installed (%.2fs)' % (bm.elapsed,))
+
+      while not ready and time.time() < deadline:
         utils.print('connecting... (%.2fs)' % (bm.elapsed,))
 
+        # a single request that returns when BBT is ready, rather than one request per second until it is
+        self.config.timeout = max(int(deadline - time.time()), 2)
         try:
           ready = self.execute("""
-            if (!Zotero.BetterBibTeX) {
-              Zotero.debug('{better-bibtex:debug bridge}: startup: BetterBibTeX not loaded')
-              return false;
+            const deadline = Date.now() + wait;
+            while (!Zotero.BetterBibTeX || typeof Zotero.BetterBibTeX.ready === 'undefined') {
+              if (Date.now() > deadline) {
+                Zotero.debug(`{better-bibtex:debug bridge}: startup: BetterBibTeX ${Zotero.BetterBibTeX ? 'not initialized' : 'not loaded'}`)
+                return false;
+              }
+              await Zotero.Promise.delay(100);
             }
             if (!Zotero.BetterBibTeX.ready) {
-              if (typeof Zotero.BetterBibTeX.ready === 'boolean') {
-                Zotero.debug('{better-bibtex:debug bridge}: startup: BetterBibTeX initialization error')
-              } else {
-                Zotero.debug('{better-bibtex:debug bridge}: startup: BetterBibTeX not initialized')
-              }
+              Zotero.debug('{better-bibtex:debug bridge}: startup: BetterBibTeX initialization error')
               return false;
             }
 
@@ -291,10 +579,15 @@ class Zotero:
             if (testing && !Zotero.Prefs.get('translators.better-bibtex.testing')) throw new Error('translators.better-bibtex.testing not set!')
             Zotero.debug('{better-bibtex:debug bridge}: startup: BetterBibTeX ready!');
             return true;
-          """, testing = self.testing)
-          if ready: break
-
-        except (urllib.error.HTTPError, urllib.error.URLError,socket.timeout):
+          """, testing = self.testing, wait = max(self.config.timeout - 1, 1) * 1000)
+          if not ready: time.sleep(1)
+
+        except urllib.error.HTTPError:
+          time.sleep(1)
+        except urllib.error.URLError:
+          # bridge not listening yet; retry quickly
+          time.sleep(0.1)
+        except socket.timeout:
           pass
 
     assert ready, f'{self.client} did not start'
@@ -304,19 +597,46 @@ class Zotero:
       self.execute(f'return await Zotero.BetterBibTeX.TestSupport.importFile({json.dumps(self.import_at_start)})')
       self.import_at_start = None
 
-  def reset(self):
+    self.instance = self.config.fingerprint()
+    self.dirty = False
+
+  def listening(self):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+      return sock.connect_ex(('127.0.0.1', self.port)) == 0
+
+  def reset(self, scenario=None):
+    self.scenario = scenario
     if self.needs_restart:
+      # scenarios that use a database tend to start by restarting into one, so rather than starting a clean instance
+      # that would be thrown away right away, the start waits for the first restart or bridge call
       self.shutdown()
       self.config.reset()
-      self.start()
+      self.pending_start = True
+      self.preferences.reset(restored=False)
+      return
 
-    self.execute('await Zotero.BetterBibTeX.TestSupport.reset()')
-    self.preferences = Preferences(self)
+    if scenario is None:
+      self.execute('await Zotero.BetterBibTeX.TestSupport.reset()')
+    else:
+      self.execute_many([
+        'await Zotero.BetterBibTeX.TestSupport.reset()',
+        ('Zotero.BetterBibTeX.TestSupport.scenario = scenario', { 'scenario': scenario }),
+      ])
+    self.preferences.reset()
+    # an emptied library with the default preferences is as good as a fresh start, so a restart into the same config
+    # can keep this instance; not so for an instance started into a database or profile of its own
+    self.dirty = bool(self.config.db or self.config.profile or self.config.first_run)
 
   def reset_cache(self):
     self.execute('Zotero.BetterBibTeX.TestSupport.resetCache()')
 
+  def record_cache(self):
+    # cache activity since the last export_library of the scenario, mostly auto-exports and invalidations
+    if self.timings: self.timings.record_cache(self.execute(CACHE_STATE), 'background')
+
   def loaded(self, path):
+    # generated libraries live outside the fixtures and are not tracked
+    if not path.startswith(FIXTURES + os.sep): return
     self.fixtures_loaded.add(str(PurePath(path).relative_to(FIXTURES)))
     if self.fixtures_loaded_log:
       with open(self.fixtures_loaded_log, 'w') as f:
@@ -324,18 +644,11 @@ class Zotero:
 
   def load(self, path, attempt_patch=False):
     path = os.path.join(FIXTURES, path)
-
-    with open(path) as f:
-      if path.endswith('.json'):
-        data = json.load(f, object_pairs_hook=OrderedDict)
-      elif path.endswith('.yml'):
-        data = yaml.load(f)
-      else:
-        data = f.read()
-
     patch = path + '.' + self.client + '.patch'
+    patched = attempt_patch and os.path.exists(patch)
+    validate = path.endswith('.json') and not (path.endswith('.csl.json') or path.endswith('.schomd.json'))
 
-    if not attempt_patch or not os.path.exists(patch):
+    if not patched:
       loaded = path
     else:
       for ext in ['.schomd.json', '.csl.json', os.path.splitext(path)[1]]:
@@ -343,22 +656,36 @@ class Zotero:
           loaded = path[:-len(ext)] + '.' + self.client + ext
           break
 
-      if path.endswith('.json') or path.endswith('.yml'):
-        with open(patch) as f:
-          data = jsonpatch.JsonPatch(json.load(f)).apply(data)
-      else:
-        with open(patch) as f:
-          dmp = diff_match_patch()
-          data = dmp.patch_apply(dmp.patch_fromText(f.read()), data)[0]
-
-    if path.endswith('.json') and not (path.endswith('.csl.json') or path.endswith('.schomd.json')):
-      validate_bbt_json(data)
+    sources = [path, patch] if patched else [path]
+    data = self.fixtures.get(sources, validate)
+    if data is None:
+      with open(path) as f:
+        if path.endswith('.json'):
+          data = json.load(f, object_pairs_hook=OrderedDict)
+        elif path.endswith('.yml'):
+          data = yaml.load(f)
+        else:
+          data = f.read()
+
+      if patched:
+        if path.endswith('.json') or path.endswith('.yml'):
+          with open(patch) as f:
+            data = jsonpatch.JsonPatch(json.load(f)).apply(data)
+        else:
+          with open(patch) as f:
+            dmp = diff_match_patch()
+            data = dmp.patch_apply(dmp.patch_fromText(f.read()), data)[0]
+
+      if validate:
+        validate_bbt_json(data)
+
+      data = self.fixtures.put(sources, validate, data)
 
     self.loaded(loaded)
     return (data, loaded)
 
   def exported(self, path, data=None):
-    path = os.path.join(EXPORTED, os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    path = os.path.join(self.exported_dir, os.path.basename(os.path.dirname(path)), os.path.basename(path))
 
     if data is None:
       os.remove(path)
@@ -382,12 +709,20 @@ class Zotero:
     else:
       translator = self.translators.byName[translator].translatorID
 
-    found = self.execute('return await Zotero.BetterBibTeX.TestSupport.exportLibrary(translatorID, displayOptions, path, collection)',
-      translatorID=translator,
-      displayOptions=displayOptions,
-      path=output,
-      collection=collection
-    )
+    export = ('return await Zotero.BetterBibTeX.TestSupport.exportLibrary(translatorID, displayOptions, path, collection)', {
+      'translatorID': translator,
+      'displayOptions': displayOptions,
+      'path': output,
+      'collection': collection,
+    })
+    if self.timings:
+      # library size and the cache statistics on either side of the export ride along in the same round-trip
+      before, found, items, after = self.execute_many([CACHE_STATE, export, 'return await Zotero.BetterBibTeX.TestSupport.librarySize()', CACHE_STATE])
+      self.timings.annotate(translator=self.translators.byId.get(translator, Munch(label=translator)).label, items=items)
+      self.timings.record_cache(before, 'background')
+      self.timings.record_cache(after, 'export', { option: value for option, value in displayOptions.items() if option != 'Normalize' })
+    else:
+      found = self.execute(export[0], **export[1])
     if resetCache: self.execute('Zotero.BetterBibTeX.TestSupport.resetCache()')
 
     if expected is None: return
@@ -411,7 +746,7 @@ class Zotero:
 
       expected = Library(expected)
       found = Library(json.loads(found, object_pairs_hook=OrderedDict))
-      assert_equal_diff(serialize(extra_lower(expected)), serialize(extra_lower(found)))
+      assert_equal_library(extra_lower(expected), extra_lower(found), text=self.text_diff)
 
     elif expected_file.endswith('.html'):
       assert_equal_diff(clean_html(expected).strip(), clean_html(found).strip())
@@ -424,34 +759,46 @@ class Zotero:
   def import_file(self, context, references, collection = False, items=True):
     assert type(collection) in [bool, str]
 
-    data, references = self.load(references)
+    path = os.path.join(FIXTURES, references)
+    if references.endswith('.json') and os.path.getsize(path) > STREAM_IMPORT:
+      # checked in a single streaming pass; items are validated one at a time, the rest of the library against the
+      # same schema as a library that is loaded whole, with the items left out
+      library = {}
+      for kind, data in self.stream_library(path):
+        if kind == 'key':
+          library[data] = [] if data == 'items' else None
+        elif kind == 'item':
+          validate_bbt_json_item(data)
+          self.check_attachments(path, data)
+        else:
+          library[kind] = data
+      validate_bbt_json(library)
+      config = library['config']
+      self.loaded(path)
+      references = path
+
+    elif references.endswith('.json'):
+      data, references = self.load(references)
+      config = data.get('config', {})
+      for item in data['items']:
+        self.check_attachments(references, item)
+
+    else:
+      # other formats are handed to Zotero as-is
+      self.loaded(path)
+      references = path
 
     if references.endswith('.json'):
       # TODO: clean lib and test against schema
-      config = data.get('config', {})
       preferences = config.get('preferences', {})
       localeDateOrder = config.get('localeDateOrder', None)
       context.displayOptions = config.get('options', {})
 
       # TODO: this can go because the schema check will assure it won't get passed in
       if 'testing' in preferences: del preferences['testing']
-      preferences = {
-        pref: (','.join(value) if type(value) == list else value)
-        for pref, value in preferences.items()
-        if not self.preferences.prefix + pref in self.preferences.keys()
-      }
-
-      for k, v in preferences.items():
-        assert self.preferences.prefix + k in self.preferences.supported, f'Unsupported preference "{k}"'
-        assert type(v) == self.preferences.supported[self.preferences.prefix + k], f'Value for preference {k} has unexpected type {type(v)}'
-      for item in data['items']:
-        for att in item.get('attachments') or []:
-          if path := att.get('path'):
-            path = os.path.join(os.path.dirname(references), path)
-            assert os.path.exists(path), f'attachment {path} does not exist'
+      self.preferences.apply({ '.' + pref: (','.join(value) if type(value) == list else value) for pref, value in preferences.items() }, explicit=False)
     else:
       context.displayOptions = {}
-      preferences = None
       localeDateOrder = None
 
     with tempfile.TemporaryDirectory() as d:
@@ -461,29 +808,49 @@ class Zotero:
         shutil.copy(orig, references)
 
       if '.bib' in references:
+        # line-by-line filter into the temp dir, only used when it actually rewrote the JabRef file directory
         copy = False
-        bib = ''
-        with open(references) as f:
-          for line in f.readlines():
+        rewritten = os.path.join(d, os.path.basename(references) + '_')
+        with open(references) as f, open(rewritten, 'w') as out:
+          for line in f:
             if line.lower().startswith('@comment{jabref-meta: filedirectory:'):
-              bib += f"@Comment{{jabref-meta: fileDirectory:{os.path.join(os.path.dirname(references), 'attachments')};}}\n"
+              out.write(f"@Comment{{jabref-meta: fileDirectory:{os.path.join(os.path.dirname(references), 'attachments')};}}\n")
               copy = True
             else:
-              bib += line
-        if copy:
-          references += '_'
-          with open(references, 'w') as out:
-            out.write(bib)
+              out.write(line)
+        if copy: references = rewritten
 
       filename = references
       if not items: filename = None
-      return self.execute('return await Zotero.BetterBibTeX.TestSupport.importFile(filename, createNewCollection, preferences, localeDateOrder)',
+      # the fixture preferences have been applied above
+      return self.execute('return await Zotero.BetterBibTeX.TestSupport.importFile(filename, createNewCollection, null, localeDateOrder)',
         filename = filename,
         createNewCollection = (collection != False),
-        preferences = preferences,
         localeDateOrder = localeDateOrder
       )
 
+  def check_attachments(self, references, item):
+    for att in item.get('attachments') or []:
+      if path := att.get('path'):
+        path = os.path.join(os.path.dirname(references), path)
+        assert os.path.exists(path), f'attachment {path} does not exist'
+
+  def stream_library(self, path):
+    # yields ('key', name) for every top-level key, and ('config', config), ('collections', collections) and
+    # ('item', item) in file order, holding at most one item in memory
+    building = None
+    with open(path, 'rb') as f:
+      for prefix, event, value in ijson.parse(f, use_float=True):
+        if building is None:
+          if prefix == '' and event == 'map_key': yield 'key', value
+          if event != 'start_map' or prefix not in ['config', 'collections', 'items.item']: continue
+          building, builder = prefix, ijson.ObjectBuilder()
+
+        builder.event(event, value)
+        if event == 'end_map' and prefix == building:
+          yield ('item' if building == 'items.item' else building), builder.value
+          building = None
+
   def expand_expected(self, expected):
     base, ext = os.path.splitext(expected)
     if ext in ['.yml', '.json'] and base.endswith('.csl'):
@@ -502,7 +869,7 @@ class Zotero:
 
   def create_profile(self):
     profile = Munch(
-      name='BBTZ5TEST'
+      name='BBTZ5TEST' + (f'-{self.worker}' if self.worker else '')
     )
 
     profile.path = os.path.expanduser(f'~/.{profile.name}')
@@ -525,6 +892,10 @@ class Zotero:
     # create profile
     profile.ini = os.path.join(profile.profiles, 'profiles.ini')
 
+    # profiles.ini is shared between parallel workers
+    lock = open(profile.ini + '.lock', 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+
     ini = configparser.RawConfigParser()
     ini.optionxform = str
     if os.path.exists(profile.ini): ini.read(profile.ini)
@@ -550,27 +921,85 @@ class Zotero:
     ini.set(profile.id, 'Default', None)
     with open(profile.ini, 'w') as f:
       ini.write(f, space_around_delimiters=False)
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
+
+    if self.config.db: self.needs_restart = True
+    template = self.profile_template(profile)
+
+    shutil.rmtree(profile.path, ignore_errors=True)
+    shutil.copytree(template, profile.path, copy_function=link_or_copy)
+    # the bridge password changes on every run, so it is kept out of the cached template
+    with open(os.path.join(profile.path, 'user.js'), 'a') as f:
+      f.write(f'user_pref("extensions.zotero.debug-bridge.password", {json.dumps(self.password)});\n')
 
-    # layout profile
+    return profile
+
+  def fetch_db(self):
+    utils.print(f'restarting using {self.config.db}')
+    dbs = os.path.join(ROOT, 'test', 'db', self.config.db)
+    if not os.path.exists(dbs): os.makedirs(dbs)
+
+    db_zotero = os.path.join(dbs, f'{self.client}.sqlite')
+    db_zotero_alt = os.path.join(dbs, self.client, f'{self.client}.sqlite')
+    if not os.path.exists(db_zotero) and not os.path.exists(db_zotero_alt):
+      urllib.request.urlretrieve(f'https://github.com/retorquere/zotero-better-bibtex/releases/download/test-database/{self.config.db}.zotero.sqlite', db_zotero)
+    if not os.path.exists(db_zotero): db_zotero = db_zotero_alt
+
+    db_bbt = os.path.join(dbs, 'better-bibtex.sqlite')
+    db_bbt_alt = os.path.join(dbs, self.client, 'better-bibtex.sqlite')
+    if not os.path.exists(db_bbt) and not os.path.exists(db_bbt_alt):
+      urllib.request.urlretrieve(f'https://github.com/retorquere/zotero-better-bibtex/releases/download/test-database/{self.config.db}.better-bibtex.sqlite', db_bbt)
+    if not os.path.exists(db_bbt): db_bbt = db_bbt_alt
+
+    return Munch(zotero=db_zotero, bbt=db_bbt)
+
+  def profile_template(self, profile):
+    if self.config.profile:
+      base = os.path.join(ROOT, 'test/db', self.config.profile)
+    else:
+      base = os.path.join(FIXTURES, 'profile', self.client)
+
+    xpis = [os.path.join(ROOT, 'xpi'), os.path.join(ROOT, 'other-xpis')]
+    if self.config.db: xpis.append(os.path.join(ROOT, 'test/db', self.config.db, 'xpis'))
+    if self.config.profile: xpis.append(os.path.join(ROOT, 'test/db', self.config.profile, 'xpis'))
+
+    dbs = self.fetch_db() if self.config.db else None
+
+    key = hashlib.sha256(json.dumps({
+      'client': self.client,
+      'path': profile.path,
+      'port': self.port,
+      'config': { k: getattr(self.config, k) for k in ['db', 'profile', 'locale', 'first_run', 'timeout'] },
+      'prefs': { 'testing': self.testing, 'workers': self.workers, 'caching': self.caching },
+      'base': fingerprint(base),
+      'xpis': fingerprint(*[os.path.join(xpi, '*.xpi') for xpi in xpis]),
+      'preferences': fingerprint(os.path.join(os.path.dirname(__file__), 'preferences.toml')),
+      'db': fingerprint(dbs.zotero, dbs.bbt) if dbs else None,
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+
+    template = os.path.join(PROFILES, key)
+    if os.path.exists(template):
+      utils.print(f'using cached profile template {key}')
+      # the mtime marks when a template was last used, for prune_profile_templates
+      os.utime(template)
+      return template
+    utils.print(f'creating profile template {key}')
+
+    profile.firefox = webdriver.FirefoxProfile(base)
     if self.config.profile:
-      profile.firefox = webdriver.FirefoxProfile(os.path.join(ROOT, 'test/db', self.config.profile))
       profile.firefox.set_preference('extensions.zotero.dataDir', os.path.join(profile.path, self.client))
       profile.firefox.set_preference('extensions.zotero.useDataDir', True)
       profile.firefox.set_preference('extensions.zotero.translators.better-bibtex.removeStock', False)
-    else:
-      profile.firefox = webdriver.FirefoxProfile(os.path.join(FIXTURES, 'profile', self.client))
 
-    install_xpis(os.path.join(ROOT, 'xpi'), profile.firefox)
-
-    install_xpis(os.path.join(ROOT, 'other-xpis'), profile.firefox)
-    if self.config.db: install_xpis(os.path.join(ROOT, 'test/db', self.config.db, 'xpis'), profile.firefox)
-    if self.config.profile: install_xpis(os.path.join(ROOT, 'test/db', self.config.profile, 'xpis'), profile.firefox)
+    for xpi in xpis:
+      install_xpis(xpi, profile.firefox)
 
+    profile.firefox.set_preference('extensions.zotero.httpServer.port', self.port)
     profile.firefox.set_preference('extensions.zotero.debug.memoryInfo', True)
     profile.firefox.set_preference('extensions.zotero.translators.better-bibtex.testing', self.testing)
     profile.firefox.set_preference('extensions.zotero.translators.better-bibtex.workers', self.workers)
     profile.firefox.set_preference('extensions.zotero.translators.better-bibtex.caching', self.caching)
-    profile.firefox.set_preference('extensions.zotero.debug-bridge.password', self.password)
     profile.firefox.set_preference('dom.max_chrome_script_run_time', self.config.timeout)
     utils.print(f'dom.max_chrome_script_run_time={self.config.timeout}')
 
@@ -595,32 +1024,18 @@ class Zotero:
 
     profile.firefox.update_preferences()
 
-    shutil.rmtree(profile.path, ignore_errors=True)
-    shutil.move(profile.firefox.path, profile.path)
+    layout = template + '.tmp'
+    shutil.rmtree(layout, ignore_errors=True)
+    os.makedirs(PROFILES, exist_ok=True)
+    shutil.move(profile.firefox.path, layout)
     profile.firefox = None
 
-    if self.config.db:
-      self.needs_restart = True
-      utils.print(f'restarting using {self.config.db}')
-      dbs = os.path.join(ROOT, 'test', 'db', self.config.db)
-      if not os.path.exists(dbs): os.makedirs(dbs)
-
-      db_zotero = os.path.join(dbs, f'{self.client}.sqlite')
-      db_zotero_alt = os.path.join(dbs, self.client, f'{self.client}.sqlite')
-      if not os.path.exists(db_zotero) and not os.path.exists(db_zotero_alt):
-        urllib.request.urlretrieve(f'https://github.com/retorquere/zotero-better-bibtex/releases/download/test-database/{self.config.db}.zotero.sqlite', db_zotero)
-      if not os.path.exists(db_zotero): db_zotero = db_zotero_alt
-      shutil.copy(db_zotero, os.path.join(profile.path, self.client, os.path.basename(db_zotero)))
-
-      db_bbt = os.path.join(dbs, 'better-bibtex.sqlite')
-      db_bbt_alt = os.path.join(dbs, self.client, 'better-bibtex.sqlite')
-      if not os.path.exists(db_bbt) and not os.path.exists(db_bbt_alt):
-        urllib.request.urlretrieve(f'https://github.com/retorquere/zotero-better-bibtex/releases/download/test-database/{self.config.db}.better-bibtex.sqlite', db_bbt)
-      if not os.path.exists(db_bbt): db_bbt = db_bbt_alt
-      shutil.copy(db_bbt, os.path.join(profile.path, self.client, os.path.basename(db_bbt)))
+    if dbs:
+      shutil.copy(dbs.zotero, os.path.join(layout, self.client, os.path.basename(dbs.zotero)))
+      shutil.copy(dbs.bbt, os.path.join(layout, self.client, os.path.basename(dbs.bbt)))
 
       # remove any auto-exports that may exist
-      db = sqlite3.connect(os.path.join(profile.path, self.client, os.path.basename(db_bbt)))
+      db = sqlite3.connect(os.path.join(layout, self.client, os.path.basename(dbs.bbt)))
       ae = None
       for (ae,) in db.execute('SELECT data FROM "better-bibtex" WHERE name = ?', [ 'better-bibtex.autoexport' ]):
         ae = json.loads(ae)
@@ -630,7 +1045,17 @@ class Zotero:
         db.commit()
       db.close()
 
-    return profile
+    os.rename(layout, template)
+    prune_profile_templates()
+    return template
+
+def prune_profile_templates():
+  templates = [os.path.join(PROFILES, name) for name in os.listdir(PROFILES) if not name.endswith('.tmp')]
+  templates = [template for template in templates if os.path.isdir(template)]
+  for template in sorted(templates, key=os.path.getmtime, reverse=True)[PROFILE_TEMPLATES:]:
+    utils.print(f'removing unused profile template {os.path.basename(template)}')
+    # a parallel worker may be removing it too
+    shutil.rmtree(template, ignore_errors=True)
 
 def strip_obj(data):
   if type(data) == list:
@@ -644,28 +1069,84 @@ def strip_obj(data):
   return data
 
 class Preferences:
+  prefix = 'translators.better-bibtex.'
+  # loaded once per run rather than per scenario
+  supported = None
+  defaults = None
+
   def __init__(self, zotero):
     self.zotero = zotero
+
+    if Preferences.supported is None:
+      with open(os.path.join(os.path.dirname(__file__), 'preferences.json')) as f:
+        preferences = json.load(f)
+      Preferences.supported = {self.prefix + pref['var']: type(pref['default']) for pref in preferences}
+      Preferences.supported[self.prefix + 'removeStock'] = bool
+      Preferences.supported[self.prefix + 'ignorePostscriptErrors'] = bool
+      # what TestSupport.reset() leaves behind; workers and caching are skipped by the reset when they were set at
+      # startup, so their state is not known
+      Preferences.defaults = {self.prefix + pref['var']: pref['default'] for pref in preferences if pref['var'] not in ['workers', 'caching']}
+      Preferences.defaults[self.prefix + 'testing'] = True
+
+    self.reset(restored=False)
+
+  def reset(self, restored=True):
+    # a new scenario, so nothing has been set explicitly yet; after TestSupport.reset() Zotero has the defaults
     self.pref = {}
-    self.prefix = 'translators.better-bibtex.'
-    with open(os.path.join(os.path.dirname(__file__), 'preferences.json')) as f:
-      self.supported = {self.prefix + pref['var']: type(pref['default']) for pref in json.load(f)}
-    self.supported[self.prefix + 'removeStock'] = bool
-    self.supported[self.prefix + 'ignorePostscriptErrors'] = bool
+    self.shadow = dict(self.defaults) if restored else {}
+
+  def forget(self):
+    # a (re)started Zotero has whatever the profile gave it
+    self.shadow = {}
 
   def __setitem__(self, key, value):
     if key[0] == '.': key = self.prefix + key[1:]
 
-    if key.startswith(self.prefix):
-      assert key in self.supported, f'Unknown preference "{key}"'
-      assert type(value) == self.supported[key], f'Unexpected value of type {type(value)} for preference {key}'
-
     if key == 'translators.better-bibtex.postscript':
       with open(os.path.join(FIXTURES, value)) as f:
         value = f.read()
 
-    self.pref[key] = value
-    self.zotero.execute('Zotero.Prefs.set(pref, value)', pref=key, value=value)
+    self.apply({ key: value })
+
+  def apply(self, preferences, explicit=True):
+    # everything is validated before anything is sent; what Zotero is known to have already is skipped, the rest goes
+    # out in a single bridge call. Preferences set explicitly win over those that come with a fixture
+    self.zotero.resume()
+    validated = {}
+    for key, value in preferences.items():
+      if key[0] == '.': key = self.prefix + key[1:]
+
+      if key.startswith(self.prefix):
+        assert key in self.supported, f'Unknown preference "{key}"'
+        assert type(value) == self.supported[key], f'Unexpected value of type {type(value)} for preference {key}'
+      validated[key] = value
+
+    while True:
+      # reset() and forget() replace the shadow rather than clear it, so a reset while the batch is out shows as a
+      # different shadow afterwards; what was skipped may not hold anymore, so the batch is worked out again
+      shadow = self.shadow
+      changes = {}
+      for key, value in validated.items():
+        if explicit:
+          self.pref[key] = value
+        elif key in self.pref:
+          continue
+
+        # True == 1 in python, but not for Zotero
+        if key in shadow and (type(shadow[key]), shadow[key]) == (type(value), value): continue
+        changes[key] = value
+
+      if not changes: return
+      try:
+        self.zotero.execute('for (const [pref, value] of Object.entries(changes)) { Zotero.Prefs.set(pref, value) }', changes=changes)
+      except:
+        # some may have been set, some not
+        for key in changes:
+          self.shadow.pop(key, None)
+        raise
+      if self.shadow is shadow:
+        shadow.update(changes)
+        return
 
   def keys(self):
     return self.pref.keys()
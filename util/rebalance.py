@@ -5,9 +5,17 @@ import sys
 import json
 from munch import Munch
 import re
-from ortools.algorithms import pywrapknapsack_solver
-
-ref, output = sys.argv[1:]
+import math
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('ref')
+parser.add_argument('output')
+parser.add_argument('--jobs', type=int, default=2, help='number of CI jobs whose logs are read')
+parser.add_argument('--bins', default='2', help='comma-separated bin counts to schedule for')
+args = parser.parse_args()
+ref, output = args.ref, args.output
+bin_counts = sorted(set([int(n) for n in args.bins.split(',')]))
 if not ref.startswith('refs/heads/'):
   print(ref, 'is not a branch')
   sys.exit(0)
@@ -15,16 +23,17 @@ branch = ref.split('/')[-1]
 
 print('rebalance', branch, '=>', output)
 
-for job in [1, 2]:
+for job in range(1, args.jobs + 1):
   job = f'logs/behave-zotero-{job}-{branch}.json'
   if not os.path.exists(job):
     print('not found:', job)
     sys.exit(0)
 
 class RunningAverage():
-  def __init__(self, average=None, n=0):
+  def __init__(self, average=None, n=0, stdev=0):
     self.average = average
     self.n = n
+    self.m2 = (stdev ** 2) * (n - 1) if n > 1 else 0
 
   def add(self, new_value):
     self.n += 1
@@ -32,13 +41,33 @@ class RunningAverage():
       self.average = new_value
     else:
       # https://math.stackexchange.com/questions/106700/incremental-averageing
-      self.average = self.average + ((new_value - self.average) / self.n)
+      delta = new_value - self.average
+      self.average = self.average + (delta / self.n)
+      # Welford's online variance
+      self.m2 += delta * (new_value - self.average)
+
+  @property
+  def stdev(self):
+    return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0
 
   def __float__(self):
     return self.average
 
   def __repr__(self):
-    return "average: " + str(self.average)
+    return "average: " + str(self.average) + ", stdev: " + str(self.stdev)
+
+def schedule(tests, bins):
+  # LPT: place the longest remaining test in the bin with the smallest expected finish time. A bin's expected finish
+  # time is the sum of its means plus its standard deviation (variances add), so bins full of erratic tests get some
+  # headroom
+  load = [Munch(msecs=0, variance=0, tests=[]) for _ in range(bins)]
+  finish = lambda b, test=None: (b.msecs + (test.msecs if test else 0)) + math.sqrt(b.variance + (test.stdev ** 2 if test else 0))
+  for test in sorted(tests, key=lambda test: (test.msecs + test.stdev, test.name), reverse=True):
+    b = min(load, key=lambda b: finish(b, test))
+    b.msecs += test.msecs
+    b.variance += test.stdev ** 2
+    b.tests.append(test.name)
+  return load, max(finish(b) for b in load)
 
 class NoTestError(Exception):
   pass
@@ -75,11 +104,11 @@ class Log:
     if any(1 for test in tests.values() if test.status == 'failed'): raise FailedError()
 
     for name, test in tests.items():
-      self.tests.append(Munch(name=name, msecs=test.msecs, status=status))
+      self.tests.append(Munch(name=name, msecs=test.msecs, status=test.status))
 
 log = Log()
 try:
-  for job in [1, 2]:
+  for job in range(1, args.jobs + 1):
     with open(f'logs/behave-zotero-{job}-{branch}.json') as f:
       log.load(json.load(f, object_hook=Munch.fromDict))
   print(len(log.tests), 'tests')
@@ -88,7 +117,7 @@ try:
     history = json.load(f, object_hook=Munch.fromDict)
   for name, h in list(history.duration.items()):
     if type(h) in (float, int):
-      history.duration[name] = Munch(msecs=h, runs=0)
+      history.duration[name] = Munch(msecs=h, runs=0, stdev=0)
     history.duration[name].runs += history.runs
 
   balance = Munch.fromDict({
@@ -98,35 +127,32 @@ try:
 
   for test in log.tests:
     if h:= history.duration.get(test.name):
-      avg = RunningAverage(h.msecs, h.runs)
+      avg = RunningAverage(h.msecs, h.runs, h.get('stdev', 0))
     else:
       avg = RunningAverage()
     avg.add(test.msecs)
-    balance.duration[test.name] = Munch(msecs=round(float(avg) / 10) * 10, runs=avg.n)
+    balance.duration[test.name] = Munch(msecs=round(float(avg) / 10) * 10, runs=avg.n, stdev=round(avg.stdev / 10) * 10)
 
   for status in ['slow', 'fast']:
-    tests = [test for test in log.tests if status in [ 'slow', test.status] ]
-    durations = [balance.duration[test.name].msecs for test in tests]
-
-    #if status == 'slow':
-    #  solver = pywrapknapsack_solver.KnapsackSolver.KNAPSACK_MULTIDIMENSION_BRANCH_AND_BOUND_SOLVER
-    #else:
-    #  solver = pywrapknapsack_solver.KnapsackSolver.KNAPSACK_MULTIDIMENSION_CBC_MIP_SOLVER
-    solver = pywrapknapsack_solver.KnapsackSolver.KNAPSACK_MULTIDIMENSION_CBC_MIP_SOLVER
-    solver = pywrapknapsack_solver.KnapsackSolver(solver, 'TestBalancer')
-    solver.Init([1 for n in durations], [durations], [int(sum(durations)/2)])
-    solver.Solve()
+    tests = [
+      Munch(name=test.name, msecs=balance.duration[test.name].msecs, stdev=balance.duration[test.name].stdev)
+      for test in log.tests
+      if status in [ 'slow', test.status]
+    ]
 
     balance[status] = {}
-    for _bin in [1, 2]:
-      balance[status][_bin] = [ test.name for i, test in enumerate(tests) if solver.BestSolutionContains(i) == (_bin == 1) ]
-    print(status, len(tests), 'tests,', { k: len(t) for k, t in balance[status].items()})
+    for bins in bin_counts:
+      load, makespan = schedule(tests, bins)
+      balance[status][bins] = { _bin + 1: sorted(b.tests) for _bin, b in enumerate(load) }
+      print(status, len(tests), 'tests over', bins, 'bins, expected makespan', round(makespan / 1000), 's,', { _bin + 1: len(b.tests) for _bin, b in enumerate(load) })
 
   # simplify for cleaner diffs
   for name, duration in list(balance.duration.items()):
     balance.duration[name].runs -= balance.runs
-    if balance.duration[name].runs == 0:
-      balance.duration[name] = balance.duration[name].msecs
+    if balance.duration[name].stdev == 0:
+      del balance.duration[name].stdev
+      if balance.duration[name].runs == 0:
+        balance.duration[name] = balance.duration[name].msecs
 
 except FileNotFoundError:
   print('logs incomplete')
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import sqlite3
+import argparse
+from pygit2 import Repository
+
+root = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(root, 'test/features'))
+from steps.timings import trend
+
+parser = argparse.ArgumentParser(description='report step and bridge timings recorded by the behave harness')
+parser.add_argument('db', nargs='?', default=os.path.join(root, '.cache/timings.sqlite'))
+parser.add_argument('--branch', default=Repository(root).head.shorthand)
+parser.add_argument('--threshold', type=float, default=20, help='percentage increase that counts as a regression')
+parser.add_argument('--min-msecs', type=float, default=50, help='ignore regressions smaller than this')
+args = parser.parse_args()
+
+if not os.path.exists(args.db):
+  print('no timings database at', args.db)
+  sys.exit(1)
+
+DB = sqlite3.connect(args.db)
+
+sessions = [session for (session,) in DB.execute('''
+  SELECT session
+  FROM runs
+  WHERE branch = ?
+  GROUP BY session
+  ORDER BY MAX(started) DESC
+  LIMIT 2
+''', (args.branch,))]
+if len(sessions) == 0:
+  print('no runs recorded for', args.branch)
+  sys.exit(1)
+
+def percentile(values, p):
+  # nearest-rank
+  values = sorted(values)
+  return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def stats(session, query):
+  timings = {}
+  for key, msecs in DB.execute(query, (session,)):
+    timings.setdefault(key, []).append(msecs)
+  return { key: (len(msecs), percentile(msecs, 50), percentile(msecs, 95)) for key, msecs in timings.items() }
+
+queries = {
+  'step': '''
+    SELECT step_type, msecs
+    FROM steps
+    JOIN runs ON runs.run = steps.run
+    WHERE runs.session = ? AND steps.status = 'passed'
+  ''',
+  'bridge round-trip': '''
+    SELECT label, roundtrip_msecs
+    FROM executes
+    JOIN runs ON runs.run = executes.run
+    WHERE runs.session = ?
+  ''',
+  'bridge server-side': '''
+    SELECT label, server_msecs
+    FROM executes
+    JOIN runs ON runs.run = executes.run
+    WHERE runs.session = ? AND server_msecs IS NOT NULL
+  ''',
+  'export': '''
+    SELECT translator || ' (' || items || ' items)', server_msecs
+    FROM executes
+    JOIN runs ON runs.run = executes.run
+    WHERE runs.session = ? AND translator IS NOT NULL
+  ''',
+}
+
+regressions = []
+for title, query in queries.items():
+  current = stats(sessions[0], query)
+  previous = stats(sessions[1], query) if len(sessions) > 1 else {}
+
+  print(f'\n{title}')
+  print(f'  {"n":>5} {"p50":>9} {"p95":>9}  name')
+  for key, (n, p50, p95) in sorted(current.items(), key=lambda t: t[1][2], reverse=True):
+    flag = ''
+    if prev := previous.get(key):
+      for name, now, then in [('p50', p50, prev[1]), ('p95', p95, prev[2])]:
+        if now - then > args.min_msecs and now > then * (1 + args.threshold / 100):
+          flag = ' !'
+          regressions.append(f'{title}: {key}: {name} {then:.0f}ms -> {now:.0f}ms')
+    print(f'  {n:>5} {p50:>7.0f}ms {p95:>7.0f}ms  {key}{flag}')
+
+cache = DB.execute('''
+  SELECT source, translator, options, hits, misses, invalidated
+  FROM cache
+  JOIN runs ON runs.run = cache.run
+  WHERE runs.session = ?
+''', (sessions[0],)).fetchall()
+if cache:
+  lookups = {}
+  invalidations = {}
+  for source, translator, options, hits, misses, invalidated in cache:
+    options = ', '.join(f'{option}={value}' for option, value in json.loads(options).items()) if options else ''
+    key = (translator, source, options or ('default options' if source == 'export' else ''))
+    total = lookups.setdefault(key, [0, 0])
+    total[0] += hits
+    total[1] += misses
+    for reason, n in json.loads(invalidated).items():
+      invalidations[(translator, reason)] = invalidations.get((translator, reason), 0) + n
+
+  # worst hit rate first, those are the translators and options that defeat the cache
+  print('\nexport cache')
+  print(f'  {"hits":>7} {"misses":>7} {"rate":>6}  translator | source | options')
+  for (translator, source, options), (hits, misses) in sorted(lookups.items(), key=lambda t: t[1][0] / ((t[1][0] + t[1][1]) or 1)):
+    if not (hits or misses): continue
+    print(f'  {hits:>7} {misses:>7} {hits / (hits + misses):>6.0%}  {" | ".join(part for part in [translator, source, options] if part)}')
+
+  if invalidations:
+    print('\ncache invalidations (entries dropped)')
+    for (translator, reason), n in sorted(invalidations.items(), key=lambda t: t[1], reverse=True):
+      print(f'  {n:>7}  {translator}: {reason}')
+
+memory = DB.execute('''
+  SELECT runs.worker, scenario, start_rss, peak_rss, end_rss
+  FROM memory_scenarios
+  JOIN runs ON runs.run = memory_scenarios.run
+  WHERE runs.session = ? AND peak_rss IS NOT NULL
+  ORDER BY runs.worker, seq
+''', (sessions[0],)).fetchall()
+if memory:
+  print('\nmemory high-water (RSS, MB)')
+  print(f'  {"start":>7} {"peak":>7} {"end":>7} {"growth":>7}  scenario')
+  for _, scenario, start, peak, end in sorted(memory, key=lambda m: m[3] - m[2], reverse=True)[:10]:
+    print(f'  {start:>7.0f} {peak:>7.0f} {end:>7.0f} {peak - start:>7.0f}  {scenario}')
+
+  # each parallel worker runs its own Zotero, so the baselines only form a series per worker
+  baselines = {}
+  for worker, _, start, _, _ in memory:
+    baselines.setdefault(worker, []).append(start)
+  for worker, starts in baselines.items():
+    if len(starts) < 2: continue
+    label = f' on worker {worker}' if len(baselines) > 1 else ''
+    print(f'\nscenario baseline RSS trend{label}: {trend(starts):+.2f}MB per scenario over {len(starts)} scenarios')
+
+if len(sessions) < 2:
+  print(f'\nno previous run on {args.branch} to compare against')
+elif regressions:
+  print(f'\nregressions against the previous run on {args.branch}:')
+  for regression in regressions:
+    print(' ', regression)
+else:
+  print(f'\nno regressions against the previous run on {args.branch}')